@@ -1,3 +1,6 @@
+import numpy as np
+import os
+import sys
 import time
 
 from ortools.linear_solver import pywraplp
@@ -7,6 +10,9 @@ b = {}
 
 from itertools import combinations
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionChecks import magicValid
+
 # indexes
 #      1,  2,  3
 #      4,  5,  6,  7,  8
@@ -42,26 +48,11 @@ diags = [slice(  0,     9,4), # main diag
          slice(  2,     7,2)] # off diag
 
 
-def checkMagic(square):
-    sums = []
-    sums += [sum(square[horz]) for horz in horzs]
-    sums += [sum(square[vert]) for vert in verts]
-    sums += [sum(square[diag]) for diag in diags]
-    
-    # print(f"sums: {sums}")
-    if max(sums) - min(sums) > 1:
-        return False
-    return True
-
-
 def computeSol(sol):
-    squares = [[sol[i-1] for i in sq] for sq in sqs]
-    # for square in squares:
-    for sq in sqs:
-        square = [sol[i-1] for i in sq]
-        if not checkMagic(square):
-            print(f"Invalid almost magic square: {sq}")
-            return -1
+    # all 4 squares checked at once
+    squares = np.asarray(sol)[np.array(sqs) - 1]
+    if not magicValid(squares).all():
+        return -1
 
     return sum(sol)
 
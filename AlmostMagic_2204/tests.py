@@ -0,0 +1,49 @@
+import main
+from main import sqs, ex_sol, sol, horzs, verts, diags
+from SolutionChecks import magicSpread, magicValid
+
+import numpy as np
+
+import unittest
+
+def loopSpread(square):
+    '''
+    Sum by sum spread of one square, as checkMagic did before SolutionChecks.magicSpread
+    '''
+    sums = []
+    sums += [sum(square[horz]) for horz in horzs]
+    sums += [sum(square[vert]) for vert in verts]
+    sums += [sum(square[diag]) for diag in diags]
+    return max(sums) - min(sums)
+
+class TestSetup(unittest.TestCase):
+
+    def testComputeSol(self):
+        self.assertEqual(main.computeSol(sol), 470)
+        # changing one value breaks the sums of its square
+        bad = list(sol)
+        bad[0] += 1
+        self.assertEqual(main.computeSol(bad), -1)
+
+    def testMagicSpread(self):
+        rng = np.random.default_rng(0)
+        solutions = [np.array(ex_sol), np.array(sol)]
+        # corrupted copies: one value of the answer changed
+        for _ in range(10):
+            bad = np.array(sol)
+            bad[rng.integers(len(bad))] += rng.integers(1, 5)
+            solutions.append(bad)
+        squares = np.array([s[np.array(sqs) - 1] for s in solutions]) # (solutions, 4, 9)
+        spread = magicSpread(squares)
+        self.assertEqual(spread.shape, (len(solutions), 4))
+        for k, s in enumerate(solutions):
+            for q, sq in enumerate(sqs):
+                square = s[np.array(sq) - 1]
+                self.assertEqual(spread[k, q], loopSpread(square))
+                self.assertEqual(magicSpread(square), loopSpread(square))
+                self.assertEqual(magicValid(square), loopSpread(square) <= 1)
+        self.assertTrue(magicValid(squares[1]).all())
+        self.assertFalse(magicValid(squares[2:]).all(axis=-1).any())
+
+if __name__ == '__main__':
+    unittest.main()
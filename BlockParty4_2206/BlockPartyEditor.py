@@ -0,0 +1,144 @@
+from ortools.sat.python import cp_model
+
+import numpy as np
+
+import logging
+import time
+
+from BlockPartySolver import BlockPartySolver
+
+class BlockPartyEditor(BlockPartySolver):
+    '''
+    Long-lived Block Party model for what-if edits of the clues and regions, e.g. to check
+    that a puzzle has a unique solution as clues are removed.
+
+    The variables and taxicab constraints are built once, over values 1..max_value, and
+    the edits are switched on by assumption literals at each solve:
+    * a clue is the literal x[i,j,val] itself
+    * the 1..s constraints of a region are enforced by a literal, so reassigning a cell
+        only adds the constraints of its old and new regions (the stale ones are switched
+        off), and the model is rebuilt from the current grid once max_stale regions are stale
+    Each solve is hinted with the previous solution found.
+    '''
+    def __init__(self,
+                vals_list: tuple[tuple[int, int], int],
+                grid: np.ndarray,
+                max_value: int = None,
+                time_limit: float = None,
+                max_stale: int = None):
+        self.initCallback(keep_onehot=False, time_limit=time_limit)
+        self.max_solutions = 1
+        self.previous = None # values of the last solution found
+
+        self.grid = np.array(grid)
+        N, _ = self.grid.shape
+        self.N = N
+        # largest region allowed by the edits
+        self.Nv = max_value or np.bincount(self.grid.flatten()).max()
+        # stale regions kept in the model before a rebuild, as many as the regions by default
+        self.max_stale = max_stale or len(np.unique(self.grid))
+        self.nbuilds = 0
+
+        self.buildModel()
+        self.clues = {}
+        for ij, val in vals_list:
+            self.setClue(ij, val)
+
+    def buildModel(self):
+        '''
+        Variables and taxicab constraints over values 1..max_value, and the regions of the
+        current grid
+        '''
+        tstart = time.time()
+        self.model = cp_model.CpModel()
+        allowed = np.ones((self.N, self.N, self.Nv), dtype=bool)
+        self.addValueVariables(self.model, allowed)
+        self.addTaxicabConstraints(self.model, allowed)
+
+        self.region_active = {}
+        self.nstale = 0
+        for g in np.unique(self.grid):
+            self.updateRegion(g)
+        self.nbuilds += 1
+        self.timings['build'] = time.time() - tstart
+
+    def on_solution_callback(self):
+        BlockPartySolver.on_solution_callback(self)
+        if len(self.solutions) >= self.max_solutions:
+            self.StopSearch()
+
+    def updateRegion(self, g):
+        '''
+        (Re)build the constraints of region g from the current grid
+        '''
+        ij_grid = list(zip(*np.nonzero(self.grid == g)))
+        if len(ij_grid) > self.Nv:
+            raise ValueError(f'Region {g} has {len(ij_grid)} cells, more than max_value {self.Nv}')
+        if g in self.region_active:
+            # stale constraints are switched off for good, so solutions are not repeated
+            # for both values of their literal
+            self.model.Add(self.region_active.pop(g) == 0)
+            self.nstale += 1
+        if not ij_grid:
+            return
+        active = self.model.NewBoolVar(f'region[{g}]')
+        allowed = np.ones((self.N, self.N, self.Nv), dtype=bool)
+        self.addRegionConstraints(self.model, ij_grid, allowed, active)
+        # values above the region size (implied, but propagates better)
+        for i, j in ij_grid:
+            self.model.AddBoolAnd([self.x[i,j,v].Not() for v in range(len(ij_grid)+1, self.Nv+1)]).OnlyEnforceIf(active)
+        self.region_active[g] = active
+
+    def setClue(self, ij, val):
+        if not 1 <= val <= self.Nv:
+            raise ValueError(f'Clue {val} outside 1..{self.Nv}')
+        self.clues[tuple(ij)] = val
+
+    def removeClue(self, ij):
+        del self.clues[tuple(ij)]
+
+    def setRegion(self, ij, g):
+        '''
+        Move cell ij to region g (a new region if g is not on the grid yet)
+        '''
+        ij = tuple(ij)
+        old = self.grid[ij]
+        if old == g:
+            return
+        # checked before any change, so a rejected edit leaves the grid and the model as they were
+        if (self.grid == g).sum() + 1 > self.Nv:
+            raise ValueError(f'Region {g} would have more than max_value {self.Nv} cells')
+        self.grid[ij] = g
+        if self.nstale + 2 > self.max_stale:
+            self.buildModel()
+            return
+        self.updateRegion(old)
+        self.updateRegion(g)
+
+    def solve(self, max_solutions=1):
+        '''
+        Up to max_solutions solution values under the current clues and regions
+        '''
+        tstart = time.time()
+        model = self.model
+        model.ClearAssumptions()
+        model.AddAssumptions([self.x[i, j, val] for (i, j), val in self.clues.items()] +
+                             list(self.region_active.values()))
+        model.ClearHints()
+        if self.previous is not None:
+            self.addHints(model, 'x', self.previous - 1)
+
+        solver = self.newSolver(max_solutions > 1)
+        self.max_solutions = max_solutions
+        self.solutions = []
+        self.status = solver.Solve(model, self)
+        self.timings['solve'] = time.time() - tstart
+
+        if self.solutions:
+            self.previous = self.solutions[-1][0]
+        logging.debug(f'{len(self.clues)} clues, {len(self.region_active)} regions: '
+                      f'{len(self.solutions)} solutions in {self.timings["solve"]*1000:.2f}ms')
+        return [vals for vals, _ in self.solutions]
+
+    def isUnique(self):
+        return len(self.solve(max_solutions=2)) == 1
@@ -0,0 +1,153 @@
+from ortools.sat.python import cp_model
+
+import numpy as np
+
+import logging
+import os
+import sys
+import time
+
+from BlockPartySolver import BlockPartySolver
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SearchTimeout import SearchTimeout
+
+class BlockPartyPropagator:
+    '''
+    Constraint propagation and branching for Block Party, without CP-SAT.
+    Same interface as BlockPartySolver (solutions, status, timings).
+
+    cand[n,v-1]: cell n = i*N+j can still hold v. Propagation runs to a fixed point
+    with masks over all cells and values at once:
+    * a value fixed in a cell leaves the other cells of its region, and the cells
+        within taxicab distance < v of it (disk)
+    * v needs a candidate v at taxicab distance exactly v (ring)
+    * a value with a single candidate cell in its region is fixed there
+    When propagation stalls, the search branches on the cell with the fewest candidates.
+    '''
+    def __init__(self,
+                vals_list: tuple[tuple[int, int], int],
+                grid: np.ndarray,
+                find_all_solutions: bool,
+                keep_onehot: bool = True,
+                time_limit: float = None):
+        self.find_all_solutions = find_all_solutions
+        self.keep_onehot = keep_onehot
+        self.time_limit = time_limit # seconds, None for no limit
+        self.solutions = []
+        self.timings = {}
+        self.nnodes = 0
+
+        tstart = time.time()
+        cand = self.setup(vals_list, grid)
+        self.timings['build'] = time.time() - tstart
+
+        tstart = time.time()
+        self.status = self.solve(cand)
+        self.timings['solve'] = time.time() - tstart
+
+        if self.status == cp_model.FEASIBLE or self.status == cp_model.OPTIMAL:
+            logging.info(f'{len(self.solutions)} potential configurations found ({self.nnodes} nodes)')
+
+    def setup(self, vals_list, grid):
+        '''
+        Masks of the regions, rings and disks, and the initial candidates
+        '''
+        N, _ = grid.shape
+        self.N = N
+        region = grid.flatten()
+        sizes = np.bincount(region)[1:]
+        Nv = sizes.max()
+        self.Nv = Nv
+        vrange = np.arange(1, Nv+1)
+
+        # R[g,n]: cell n in region g+1; valid[g,v-1]: region g+1 holds v
+        R = region[None, :] == np.arange(1, len(sizes)+1)[:, None]
+        self.R = R.astype(np.float32)
+        self.valid = vrange[None, :] <= sizes[:, None]
+
+        # per value, the disk of v around each cell (distance < v) and the ring of v that
+        # needs a v, from the rings of BlockPartySolver
+        order, start = BlockPartySolver.taxicabRings(N)
+        dmax = 2*N - 2 # no cell is further
+        disk = np.zeros((Nv, N**2, N**2), dtype=bool)
+        ring = np.zeros((Nv, N**2, N**2), dtype=bool)
+        for v in vrange:
+            for n in range(N**2):
+                disk[v-1, n, order[n, :start[n, min(v, dmax+1)]]] = True
+                if v <= dmax:
+                    ring[v-1, n, order[n, start[n,v]:start[n,v+1]]] = True
+
+        # cells cleared by a v fixed in cell m: other cells of its region and its disk
+        same = (R.T @ R.astype(np.int8)) > 0
+        clear = same[None] | disk
+        clear[:, np.arange(N**2), np.arange(N**2)] = False
+        self.clear = clear.astype(np.float32)
+        self.ring = ring.astype(np.float32)
+
+        cand = vrange[None, :] <= sizes[region-1][:, None]
+        for (i,j), val in vals_list:
+            cand[i*N+j] = vrange == val
+        return cand
+
+    def propagate(self, cand):
+        '''
+        Reduce cand in place to a fixed point, False on a contradiction
+        '''
+        nvals = None
+        while nvals != cand.sum():
+            nvals = cand.sum()
+            fixed = cand & (cand.sum(axis=1) == 1)[:, None]
+            # clear[v,n,m] @ fixed[m,v]: n is in the region or disk of a fixed v
+            cleared = (self.clear @ fixed.T[..., None].astype(np.float32))[..., 0].T > 0
+            # ring[v,n,m] @ cand[m,v]: n has a candidate v on its ring
+            supported = (self.ring @ cand.T[..., None].astype(np.float32))[..., 0].T > 0
+            cand &= ~cleared & supported
+
+            # hidden singles: one candidate cell left for a value in its region
+            counts = self.R @ cand.astype(np.float32)
+            if (counts[self.valid] == 0).any():
+                return False
+            single = (self.R.T @ ((counts == 1) & self.valid).astype(np.float32) > 0) & cand
+            cells = single.any(axis=1)
+            cand[cells] = single[cells]
+
+            if not cand.any(axis=1).all():
+                return False
+        return True
+
+    def solve(self, cand):
+        self.deadline = None if self.time_limit is None else time.time() + self.time_limit
+        try:
+            self.search(cand)
+        except SearchTimeout:
+            return cp_model.FEASIBLE if self.solutions else cp_model.UNKNOWN
+        if self.solutions and not self.find_all_solutions:
+            return cp_model.FEASIBLE
+        return cp_model.OPTIMAL if self.solutions else cp_model.INFEASIBLE
+
+    def search(self, cand):
+        '''
+        Propagate, then branch on the most constrained cell. True when the search can stop.
+        '''
+        self.nnodes += 1
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        if not self.propagate(cand):
+            return False
+        ncand = cand.sum(axis=1)
+        if (ncand == 1).all():
+            V = cand.argmax(axis=1).reshape(self.N, self.N) + 1
+            X = cand.reshape(self.N, self.N, self.Nv).astype(np.int8) if self.keep_onehot else None
+            self.solutions.append((V, X))
+            return not self.find_all_solutions
+
+        n = np.where(ncand > 1, ncand, self.Nv+1).argmin()
+        for v in np.flatnonzero(cand[n]):
+            branch = cand.copy()
+            branch[n] = False
+            branch[n, v] = True
+            if self.search(branch):
+                return True
+        return False
@@ -3,16 +3,28 @@ from ortools.sat.python import cp_model
 import numpy as np
 from itertools import product
 
+import functools
 import logging
+import os
+import sys
+import time
 
-class BlockPartySolver(cp_model.CpSolverSolutionCallback):
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionCallback import ArraySolutionCallback
+
+class BlockPartySolver(ArraySolutionCallback):
     def __init__(self, 
                 vals_list: tuple[tuple[int, int], int], 
                 grid: np.ndarray,
-                find_all_solutions: bool):
-        cp_model.CpSolverSolutionCallback.__init__(self)
+                find_all_solutions: bool,
+                keep_onehot: bool = True,
+                time_limit: float = None,
+                presolve: bool = True,
+                num_search_workers: int = 0):
+        self.initCallback(keep_onehot, time_limit)
         self.find_all_solutions = find_all_solutions
-        self.solutions = []
+        self.presolve = presolve # only create the values left by valueDomains
+        self.num_search_workers = num_search_workers # 0 lets CP-SAT use all cores
         status = self.solveBlockParty(vals_list, grid)
 
         if status == cp_model.INFEASIBLE:
@@ -20,25 +32,31 @@ class BlockPartySolver(cp_model.CpSolverSolutionCallback):
         elif status == cp_model.FEASIBLE or status == cp_model.OPTIMAL:
             logging.info(f'{len(self.solutions)} potential configurations found')
 
+    def initCallback(self, keep_onehot, time_limit):
+        '''
+        State of the solution callback, shared with subclasses building their own model
+        '''
+        ArraySolutionCallback.__init__(self, keep_onehot)
+        self.time_limit = time_limit # seconds, None for no limit
+        self.timings = {}
+        self.solutions = []
+
+    def newSolver(self, enumerate_all_solutions, num_search_workers=0):
+        solver = cp_model.CpSolver()
+        solver.parameters.enumerate_all_solutions = enumerate_all_solutions
+        solver.parameters.num_search_workers = num_search_workers
+        if self.time_limit is not None:
+            solver.parameters.max_time_in_seconds = self.time_limit
+        return solver
+
     def on_solution_callback(self):
         solution = self.assignSol()
         self.solutions.append(solution)
 
     def assignSol(self):
-        N = self.N
-        Nv = self.Nv
-        x = self.x
-        X = np.zeros((N, N, Nv), dtype=int)
-        V = np.zeros((N, N), dtype=int)
-        irange = [i for i in range(N)] # (0 to N)
-        ijrange = list(product(irange, irange))
-        vrange = [v for v in range(1, Nv+1)] # (1 to M)
-        for i,j in ijrange:
-            for v in vrange:
-                if self.Value(x[i,j,v]):
-                    X[i,j,v-1] = 1
-                    V[i,j] += v
-        return V, X
+        X = self.arrayValue('x', self.solutionValues())
+        V = self.decodeOneHot(X, offset=1)
+        return V, X if self.keep_onehot else None
 
     @staticmethod
     def taxicabDist(ij1: tuple[int, int], ij2: tuple[int, int]) -> int:
@@ -51,58 +69,168 @@ class BlockPartySolver(cp_model.CpSolverSolutionCallback):
         dj = abs(j2-j1)
         return di + dj
 
-    def solveBlockParty(self, vals_list, grid):
-        model = cp_model.CpModel()
-
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def taxicabRings(N: int):
+        '''
+        Index of the taxicab rings and disks around every cell n = i*N+j of an NxN board,
+        cached per board size: order[n] lists the cells by distance from n and start[n,d]
+        is where distance d begins, so that
+            ring of radius d: order[n, start[n,d]:start[n,d+1]]
+            disk of radius < d: order[n, :start[n,d]]
+        for 0 <= d <= 2N-1.
+        '''
+        i, j = np.divmod(np.arange(N**2), N)
+        dist = np.abs(i[:, None] - i[None, :]) + np.abs(j[:, None] - j[None, :])
+        order = np.argsort(dist, axis=1, kind='stable')
+
+        # number of cells at each distance, one row of bins per cell
+        D = 2*N - 1
+        counts = np.bincount((dist + D*np.arange(N**2)[:, None]).ravel(), minlength=N**2*D).reshape(N**2, D)
+        start = np.zeros((N**2, D+1), dtype=int)
+        start[:, 1:] = counts.cumsum(axis=1)
+        return order, start
+
+    @classmethod
+    def valueDomains(cls, vals_list, grid, Nv):
+        '''
+        allowed[n,v-1]: cell n = i*N+j can still hold v, propagated to a fixed point from
+        * the size of the region of the cell (values 1..s in a region of s cells)
+        * the prescribed values
+        * a value fixed in a cell is not in the other cells of its region, nor within
+            taxicab distance < v of it
+        * a value with a single possible cell in its region is fixed there
+        * v needs a cell that can hold v at taxicab distance exactly v
+        '''
         N, _ = grid.shape
-        self.N = N
-
-        ngrids = grid.max()
-
-        Nv = max((grid==g).sum() for g in range(1, ngrids+1)) # maximum number
-        self.Nv = Nv
+        order, start = cls.taxicabRings(N)
+        dmax = 2*N - 2 # no cell is further
+        region = grid.flatten()
+        sizes = np.bincount(region)
 
-        irange = [n for n in range(N)] # (0 to N-1)
-        ijrange = list(product(irange, irange))
-        vrange = [v for v in range(1, Nv+1)] # (1 to M)
-        Grange = [g+1 for g in range(ngrids)] # grid index
+        allowed = np.arange(1, Nv+1)[None, :] <= sizes[region][:, None]
+        for (i,j), val in vals_list:
+            allowed[i*N+j] = np.arange(1, Nv+1) == val
+
+        nallowed = None
+        while nallowed != allowed.sum():
+            nallowed = allowed.sum()
+            for n in np.flatnonzero(allowed.sum(axis=1) == 1):
+                v = allowed[n].argmax() + 1
+                allowed[region == region[n], v-1] = False
+                allowed[order[n, :start[n, min(v, dmax+1)]], v-1] = False # disk, from n itself
+                allowed[n, v-1] = True
+            for g in range(1, len(sizes)):
+                for v in range(1, sizes[g]+1):
+                    cells = np.flatnonzero((region == g) & allowed[:, v-1])
+                    if len(cells) == 1:
+                        allowed[cells[0]] = np.arange(1, Nv+1) == v
+            for n, v in zip(*np.nonzero(allowed)):
+                v += 1
+                if v > dmax or not allowed[order[n, start[n,v]:start[n,v+1]], v-1].any():
+                    allowed[n, v-1] = False
+        return allowed
+
+    def addValueVariables(self, model, allowed):
+        '''
+        x[i,j,v]: cell (i,j) holds v, for the allowed values (N, N, Nv), each cell holding one
+        '''
+        N, _, Nv = allowed.shape
+        ijrange = list(product(range(N), range(N)))
+        vrange = range(1, Nv+1)
 
         ## Define and save variables
+        # values ruled out by the presolve all share one constant 0
+        zero = model.NewConstant(0) if not allowed.all() else None
         x = {}
         for i,j in ijrange:
             for v in vrange:
-                x[i,j,v] = model.NewBoolVar(f'x[{i},{j},{v}]')
+                if allowed[i,j,v-1]:
+                    x[i,j,v] = model.NewBoolVar(f'x[{i},{j},{v}]')
         self.x = x
+        self.addArray('x', (x.get((i,j,v), zero) for i,j in ijrange for v in vrange), (N, N, Nv))
 
 
         ## UNIQUENESS constraints
         # each (i,j) has exactly one (v)
         for i,j in ijrange:
-            model.AddExactlyOne(x[i,j,v] for v in vrange)
+            model.AddExactlyOne(x[i,j,v] for v in vrange if allowed[i,j,v-1])
 
-        ## Taxicab constraint
+    def addTaxicabConstraints(self, model, allowed):
+        '''
+        The nearest other v of a cell holding v is at taxicab distance exactly v
+        '''
+        N, _, Nv = allowed.shape
         M = Nv+1 # big M - 
-        for i,j in ijrange:
-            for v in vrange:
-                ij_taxi_edge = [(i2,j2) for i2,j2 in ijrange if self.taxicabDist((i,j), (i2,j2)) == v]
-                model.Add(sum(x[i,j,v] for i,j in ij_taxi_edge) >= x[i,j,v])
+        order, start = self.taxicabRings(N)
+        xn = self.var_arrays['x'].reshape(N**2, Nv)
+        alive = allowed.reshape(N**2, Nv)
+        dmax = 2*N - 2 # no cell is further
+        for n in range(N**2):
+            for v in range(1, Nv+1):
+                if not alive[n, v-1]:
+                    continue
+                ij_taxi_edge = order[n, start[n,v]:start[n,v+1]] if v <= dmax else []
+                ij_taxi_edge = [n2 for n2 in ij_taxi_edge if alive[n2, v-1]]
+                model.Add(cp_model.LinearExpr.Sum(list(xn[ij_taxi_edge, v-1])) >= xn[n, v-1])
+
+                ij_taxi_inner = order[n, :start[n,min(v, dmax+1)]]
+                ij_taxi_inner = [n2 for n2 in ij_taxi_inner if alive[n2, v-1]]
+                model.Add(cp_model.LinearExpr.Sum(list(xn[ij_taxi_inner, v-1])) <= M*(1-xn[n, v-1]) +1) # +1 for self
+
+    def addRegionConstraints(self, model, ij_grid, allowed, active=None):
+        '''
+        1 to Ng appears once in the region of Ng cells ij_grid, only if active (a literal) is given
+        '''
+        for v in range(1, len(ij_grid)+1):
+            ct = model.AddExactlyOne(self.x[i,j,v] for i,j in ij_grid if allowed[i,j,v-1])
+            if active is not None:
+                ct.OnlyEnforceIf(active)
+
+    def solveBlockParty(self, vals_list, grid):
+        tstart = time.time()
+        model = cp_model.CpModel()
+
+        N, _ = grid.shape
+        self.N = N
+
+        ngrids = grid.max()
+
+        Nv = max((grid==g).sum() for g in range(1, ngrids+1)) # maximum number
+        self.Nv = Nv
+
+        irange = [n for n in range(N)] # (0 to N-1)
+        ijrange = list(product(irange, irange))
+        Grange = [g+1 for g in range(ngrids)] # grid index
+
+        if self.presolve:
+            allowed = self.valueDomains(vals_list, grid, Nv).reshape(N, N, Nv)
+        else:
+            allowed = np.ones((N, N, Nv), dtype=bool)
 
-                ij_taxi_inner = [(i2,j2) for i2,j2 in ijrange if self.taxicabDist((i,j), (i2,j2)) < v]
-                model.Add(sum(x[i,j,v] for i,j in ij_taxi_inner) <= M*(1-x[i,j,v]) +1) # +1 for self
+        self.addValueVariables(model, allowed)
+        self.addTaxicabConstraints(model, allowed)
 
         # prescribed values
+        xn = self.var_arrays['x'].reshape(N**2, Nv)
         for (i,j), val in vals_list:
-            model.Add(x[i,j,val] == 1)
+            model.Add(xn[i*N+j, val-1] == 1)
         # 1 to Ng appears in each grid of size Ng
         for g in Grange:
-            Mg = (grid==g).sum()
             ij_grid = [(i,j) for i,j in ijrange if grid[i,j] == g]
-            for v in range(1, Mg+1):
-                model.AddExactlyOne(x[i,j,v] for i,j in ij_grid)
+            self.addRegionConstraints(model, ij_grid, allowed)
+
+        proto = model.Proto()
+        logging.info(f'{allowed.sum()} of {allowed.size} cell values kept by the presolve: '
+                     f'{len(proto.variables)} variables, {len(proto.constraints)} constraints')
+
+        self.model = model
+        self.timings['build'] = time.time() - tstart
 
         # SOLVE
-        solver = cp_model.CpSolver()
-        solver.parameters.enumerate_all_solutions = self.find_all_solutions
+        tstart = time.time()
+        solver = self.newSolver(self.find_all_solutions, self.num_search_workers)
         status = solver.Solve(model, self)
+        self.timings['solve'] = time.time() - tstart
         return status
 
@@ -0,0 +1,129 @@
+import numpy as np
+import time
+
+import main
+from BlockPartySolver import BlockPartySolver
+from BlockPartyEditor import BlockPartyEditor
+from itertools import product
+from SolutionChecks import taxicabValid
+
+def blockGrid(N, h, w):
+    '''
+    NxN board cut into h x w blocks (clipped at the edges), numbered from 1
+    '''
+    i, j = np.divmod(np.arange(N**2), N)
+    blocks = (i // h) * ((N + w - 1) // w) + j // w
+    return blocks.reshape(N, N) + 1
+
+def scanRings(N, Nv):
+    '''
+    Rings and disks of every cell found by scanning the board with taxicabDist, as the
+    model was built before taxicabRings
+    '''
+    ijrange = list(product(range(N), range(N)))
+    for i,j in ijrange:
+        for v in range(1, Nv+1):
+            ij_taxi_edge = [(i2,j2) for i2,j2 in ijrange if BlockPartySolver.taxicabDist((i,j), (i2,j2)) == v]
+            ij_taxi_inner = [(i2,j2) for i2,j2 in ijrange if BlockPartySolver.taxicabDist((i,j), (i2,j2)) < v]
+
+def benchmark(N, h=2, w=3):
+    '''
+    Time to index the rings of an NxN board, the old scan it replaces, and the whole model build
+    '''
+    grid = blockGrid(N, h, w)
+    Nv = h*w
+    print(f'====={N}x{N}, {grid.max()} regions of up to {Nv} cells=====')
+
+    BlockPartySolver.taxicabRings.cache_clear()
+    tstart = time.time()
+    BlockPartySolver.taxicabRings(N)
+    print(f'taxicabRings: {(time.time() - tstart)*1000:10.2f}ms')
+    tstart = time.time()
+    scanRings(N, Nv)
+    print(f'  scanRings: {(time.time() - tstart)*1000:10.2f}ms')
+
+    # the cells are not constrained by prescribed values: cap the search, only the build is timed
+    solver = BlockPartySolver((), grid, False, keep_onehot=False, time_limit=1)
+    proto = solver.model.Proto()
+    print(f'model build: {solver.timings["build"]*1000:10.2f}ms, '
+          f'{len(proto.variables)} variables, {len(proto.constraints)} constraints')
+
+def benchmarkPresolve(name, grid, vals_list, find_all_solutions=True):
+    '''
+    Model size, build and solve time without and with the value domain presolve
+    '''
+    print(f'====={name}, presolve=====')
+    for presolve in (False, True):
+        solver = BlockPartySolver(vals_list, grid, find_all_solutions, keep_onehot=False, presolve=presolve)
+        proto = solver.model.Proto()
+        print(f'{str(presolve):>5}: {len(proto.variables):5d} variables, {len(proto.constraints):5d} constraints, '
+              f'build {solver.timings["build"]*1000:8.2f}ms, solve {solver.timings["solve"]*1000:8.2f}ms, '
+              f'{len(solver.solutions)} solutions')
+
+def benchmarkBackends(name, grid, vals_list, expected=None, repeat=5):
+    '''
+    Time findSolution with each backend (best of repeat), for the first and all solutions
+    '''
+    print(f'====={name}, backends=====')
+    for find_all_solutions in (False, True):
+        for backend in ('cpsat', 'propagate'):
+            elapsed = []
+            for _ in range(repeat):
+                tstart = time.time()
+                solutions = main.findSolution(grid, vals_list, find_all_solutions, backend=backend)
+                elapsed.append(time.time() - tstart)
+            check = '' if expected is None else f', matches: {all((vals == expected).all() for vals in solutions)}'
+            print(f'{backend:>9} (find_all_solutions={find_all_solutions!s:>5}): {min(elapsed)*1000:8.2f}ms, '
+                  f'{len(solutions)} solutions{check}')
+
+def benchmarkVerify(N, nboards=1000, seed=0):
+    '''
+    Time the batched taxicab check on random NxN boards
+    '''
+    rng = np.random.default_rng(seed)
+    boards = rng.integers(1, 6, (nboards, N, N))
+    tstart = time.time()
+    valid = taxicabValid(boards)
+    print(f'====={nboards} random {N}x{N} boards: checked in {(time.time() - tstart)*1000:.2f}ms, '
+          f'{valid.sum()} valid=====')
+
+def benchmarkEditor(name, grid, vals_list):
+    '''
+    Uniqueness check after removing each clue in turn, with the editor against a rebuild
+    '''
+    print(f'====={name}, clue removal=====')
+    editor = BlockPartyEditor(vals_list, grid)
+    editor.solve()
+    print(f'editor build {editor.timings["build"]*1000:.2f}ms, first solve {editor.timings["solve"]*1000:.2f}ms')
+    for ij, val in vals_list:
+        editor.removeClue(ij)
+        unique = editor.isUnique()
+        edit = editor.timings['solve']
+        editor.setClue(ij, val)
+
+        tstart = time.time()
+        solver = BlockPartySolver([clue for clue in vals_list if clue[0] != ij], grid, True, keep_onehot=False)
+        rebuild = time.time() - tstart
+        print(f'without {ij}: unique {unique!s:>5} ({len(solver.solutions) == 1!s:>5} rebuilt), '
+              f'edit {edit*1000:8.2f}ms, rebuild {rebuild*1000:8.2f}ms')
+
+def benchmarkCubes(name, grid, vals_list, nprocs_list=(1, 2, 4)):
+    '''
+    Time to enumerate all solutions (e.g. prove uniqueness) with cube and conquer
+    '''
+    print(f'====={name}, cube and conquer, find_all_solutions=True=====')
+    for nprocs in nprocs_list:
+        tstart = time.time()
+        solutions = main.findSolution(grid, vals_list, True, nprocs=nprocs)
+        print(f'{nprocs} processes: {(time.time() - tstart)*1000:8.2f}ms, {len(solutions)} solutions')
+
+if __name__ == '__main__':
+    benchmarkCubes('puzzle 10x10', main.grid, main.vals_list)
+    benchmarkEditor('puzzle 10x10', main.grid, main.vals_list)
+    benchmarkVerify(10)
+    benchmarkBackends('example 5x5', main.ex_grid, main.ex_vals_list, expected=main.ex_vals)
+    benchmarkBackends('puzzle 10x10', main.grid, main.vals_list)
+    benchmarkPresolve('example 5x5', main.ex_grid, main.ex_vals_list)
+    benchmarkPresolve('puzzle 10x10', main.grid, main.vals_list)
+    for N in (10, 20, 30):
+        benchmark(N)
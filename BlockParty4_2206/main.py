@@ -1,13 +1,16 @@
 import numpy as np
 import time
 import logging
+import multiprocessing
+import os
+import sys
 
 from BlockPartySolver import BlockPartySolver
-from itertools import product
+from BlockPartyPropagator import BlockPartyPropagator
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-logging.basicConfig(filename='blockparty4.log', filemode='w',
-    level=logging.INFO,
-    format='[%(levelname)s] %(message)s')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionChecks import taxicabErrors, taxicabValid
 
 ex_grid = np.array([
     [1,1,2,2,2],
@@ -60,40 +63,117 @@ vals_list = (
 )
 
 def checkTaxicab(vals):
-    N, _ = vals.shape
-    Nv = vals.max()
-    irange = [i for i in range(N)] # (0 to N)
-    ijrange = list(product(irange, irange))
-
-    correct = True
-
-    for i,j in ijrange:
-        ij2 = [(i2,j2) for i2, j2 in ijrange if vals[i2, j2] == vals[i,j] and (i2,j2) != (i,j)]
-        dist = list(map(lambda ij2: BlockPartySolver.taxicabDist((i,j), ij2), ij2))
-        if min(dist) < vals[i,j]:
-            print(f"{vals[i,j]} at {i},{j} has a closer neighbour")
-            correct = False
-        if vals[i,j] not in dist:
-            print(f"{vals[i,j]} at {i},{j} has no correct neighbour")
-            correct = False
-
-    return correct
+    closer, missing = taxicabErrors(vals)
+    for i, j in zip(*np.nonzero(closer)):
+        print(f"{vals[i,j]} at {i},{j} has a closer neighbour")
+    for i, j in zip(*np.nonzero(missing)):
+        print(f"{vals[i,j]} at {i},{j} has no correct neighbour")
+    return not (closer.any() or missing.any())
 
 def computeSol(vals):
     products = [np.product(row) for row in vals]
     return sum(products)
 
-def findSolution(grid, vals_list, find_all_solutions = False):
+def cubes(grid, vals_list, ncubes, max_depth = None, time_budget = None):
+    '''
+    Split the search into about ncubes independent subproblems (cubes), as vals_list
+    with a few more cells fixed. Each round splits every cube on its cell with the fewest values
+    left (but more than one) after the presolve of BlockPartySolver.valueDomains, and cubes
+    the presolve finds infeasible are dropped.
+    The presolve of every cube is paid in the parent process before any worker starts, so
+    the splitting is bounded rather than chasing ncubes when infeasible cubes keep the count down:
+    max_depth: most rounds of splitting, by default enough to reach ncubes by halving (log2(ncubes))
+    time_budget: optional seconds after which the cubes left are kept as they are (the cubes
+        then depend on the machine load, so max_depth alone bounds the splitting by default)
+    '''
     N, _ = grid.shape
-    solutions = []
+    Nv = np.bincount(grid.flatten()).max()
+    max_depth = int(np.ceil(np.log2(max(ncubes, 2)))) if max_depth is None else max_depth
+    deadline = None if time_budget is None else time.time() + time_budget
+    result = [tuple(vals_list)]
+    for _ in range(max_depth):
+        if len(result) >= ncubes:
+            break
+        split = []
+        for cube in result:
+            if deadline is not None and time.time() > deadline:
+                split.append(cube)
+                continue
+            allowed = BlockPartySolver.valueDomains(cube, grid, Nv)
+            sizes = allowed.sum(axis=1)
+            if not sizes.all():
+                continue
+            if (sizes == 1).all():
+                split.append(cube) # nothing left to split on
+                continue
+            n = int(np.where(sizes > 1, sizes, Nv+1).argmin())
+            split += [cube + (((n // N, n % N), int(v)),) for v in np.flatnonzero(allowed[n]) + 1]
+        if split == result:
+            break
+        result = split
+    return result
+
+def solveCube(grid, cube, find_all_solutions):
+    '''
+    Worker task: solutions of one cube on a single core
+    '''
+    solver = BlockPartySolver(cube, grid, find_all_solutions, keep_onehot=False, num_search_workers=1)
+    return [vals for vals, _ in solver.solutions]
+
+def findSolutionCubes(grid, vals_list, find_all_solutions, nprocs = None, ncubes = None):
+    '''
+    Cube and conquer: solve the cubes over a process pool, merging their solutions as they
+    arrive. In first-solution mode the remaining cubes are cancelled once a solution is found.
+    '''
+    nprocs = nprocs or multiprocessing.cpu_count()
+    todo = cubes(grid, vals_list, ncubes or 4*nprocs)
+    logging.info(f'{len(todo)} cubes over {nprocs} processes')
+
+    solutions = {}
+    with ProcessPoolExecutor(nprocs) as executor:
+        pending = {executor.submit(solveCube, grid, cube, find_all_solutions) for cube in todo}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for vals in future.result():
+                    solutions.setdefault(vals.tobytes(), vals)
+            if solutions and not find_all_solutions:
+                executor.shutdown(wait=True, cancel_futures=True)
+                break
+    solutions = list(solutions.values())
+    return solutions if find_all_solutions else solutions[:1]
+
+def findSolution(grid, vals_list, find_all_solutions = False, backend = 'cpsat', nprocs = 1):
+    '''
+    backend: 'cpsat' (BlockPartySolver) or 'propagate' (BlockPartyPropagator, 
+        propagation and branching without CP-SAT)
+    nprocs: number of processes solving cubes of the cpsat search (see findSolutionCubes),
+        None for all cores. CP-SAT enumerates all solutions on a single thread otherwise.
+        The propagate backend runs on a single process only.
+    '''
+    if backend == 'propagate' and nprocs != 1:
+        raise ValueError('The propagate backend runs on a single process, use nprocs=1')
 
     tstart = time.time()
-    solver = BlockPartySolver(vals_list, grid, find_all_solutions)
-
-    for vals, _ in solver.solutions:
-        solutions.append(vals)
-        if not find_all_solutions:
-            return solutions
+    if backend == 'cpsat' and nprocs != 1:
+        solutions = findSolutionCubes(grid, vals_list, find_all_solutions, nprocs)
+    elif backend == 'cpsat':
+        solver = BlockPartySolver(vals_list, grid, find_all_solutions, keep_onehot=False)
+        solutions = [vals for vals, _ in solver.solutions]
+    elif backend == 'propagate':
+        solver = BlockPartyPropagator(vals_list, grid, find_all_solutions, keep_onehot=False)
+        solutions = [vals for vals, _ in solver.solutions]
+    else:
+        raise ValueError(f'Unknown backend {backend}')
+    if not find_all_solutions:
+        solutions = solutions[:1]
+
+    # all the solutions are checked at once
+    ninvalid = (~taxicabValid(np.array(solutions))).sum() if solutions else 0
+    if ninvalid:
+        logging.error(f'{ninvalid} solutions break the taxicab rule')
+    if not find_all_solutions:
+        return solutions
 
     logging.debug(f'{(time.time() - tstart)*1000:.2f}ms elapsed, found {len(solutions)} solutions')
 
@@ -123,5 +203,9 @@ def main(grid, vals_list):
     return vals
 
 if __name__ == '__main__':
+    # only the parent process writes the log: the cube workers re-import this module
+    logging.basicConfig(filename='blockparty4.log', filemode='w',
+        level=logging.INFO,
+        format='[%(levelname)s] %(message)s')
     ex_V = main(ex_grid, ex_vals_list)
     V = main(grid, vals_list)
@@ -0,0 +1,203 @@
+import main
+from main import ex_grid, ex_vals_list, ex_vals
+from BlockPartySolver import BlockPartySolver
+from BlockPartyPropagator import BlockPartyPropagator
+from BlockPartyEditor import BlockPartyEditor
+from SolutionChecks import taxicabErrors, taxicabValid
+
+import numpy as np
+
+from itertools import product
+import unittest
+
+# answer of the 10x10 puzzle
+sol_vals = np.array([
+    [ 4, 3, 6, 5, 3, 7, 4, 9, 6, 5],
+    [ 8,10, 2, 4, 1, 1, 2, 3, 8, 2],
+    [ 9, 2, 3, 2, 1, 2, 5, 1, 2, 4],
+    [ 5, 7, 2, 1, 2, 6, 3, 1, 1, 3],
+    [ 6, 3, 1, 1, 3, 2, 1, 4, 2, 7],
+    [ 1, 1, 4, 5, 1, 1, 1, 3, 5, 6],
+    [ 3, 1, 2, 3, 2, 4, 2, 1, 2, 3],
+    [ 4, 2, 1, 1, 1, 1, 3, 1, 4, 9],
+    [ 5, 8, 3, 4, 2, 1, 6, 2, 3, 8],
+    [ 7, 6, 9,10, 5, 3, 4, 7, 2, 5]
+], dtype=int)
+
+def solutionSet(solutions):
+    return {tuple(vals.flatten()) for vals in solutions}
+
+def loopTaxicabErrors(vals):
+    '''
+    Cell by cell taxicab check, as checkTaxicab did before SolutionChecks.taxicabErrors
+    '''
+    N, _ = vals.shape
+    ijrange = list(product(range(N), range(N)))
+    closer = np.zeros((N, N), dtype=bool)
+    missing = np.zeros((N, N), dtype=bool)
+    for i,j in ijrange:
+        ij2 = [(i2,j2) for i2, j2 in ijrange if vals[i2, j2] == vals[i,j] and (i2,j2) != (i,j)]
+        dist = [BlockPartySolver.taxicabDist((i,j), ij) for ij in ij2]
+        closer[i,j] = min(dist, default=N**2) < vals[i,j]
+        missing[i,j] = vals[i,j] not in dist
+    return closer, missing
+
+class TestSetup(unittest.TestCase):
+
+    def testTaxicabRings(self):
+        for N in (1, 2, 3, 5, 8):
+            order, start = BlockPartySolver.taxicabRings(N)
+            for n in range(N**2):
+                ij = divmod(n, N)
+                # rings up to the furthest distance 2N-2, disks up to 2N-1 (the whole board)
+                for d in range(2*N):
+                    if d < 2*N-1:
+                        ring = [divmod(n2, N) for n2 in order[n, start[n,d]:start[n,d+1]]]
+                        self.assertCountEqual(ring, [(i2,j2) for i2 in range(N) for j2 in range(N)
+                                                     if BlockPartySolver.taxicabDist(ij, (i2,j2)) == d])
+                    disk = [divmod(n2, N) for n2 in order[n, :start[n,d]]]
+                    self.assertCountEqual(disk, [(i2,j2) for i2 in range(N) for j2 in range(N)
+                                                 if BlockPartySolver.taxicabDist(ij, (i2,j2)) < d])
+
+    def testValueDomains(self):
+        # the presolve never rules out a value of the answer
+        for grid, vals_list, vals in ((ex_grid, ex_vals_list, ex_vals), (main.grid, main.vals_list, sol_vals)):
+            N, _ = grid.shape
+            sizes = np.bincount(grid.flatten())
+            allowed = BlockPartySolver.valueDomains(vals_list, grid, sizes.max())
+            self.assertEqual(allowed.shape, (N**2, sizes.max()))
+            self.assertTrue(allowed[np.arange(N**2), vals.flatten()-1].all())
+            # but does rule out more than the values above the region sizes
+            self.assertLess(allowed.sum(), sizes[grid].sum())
+
+    def testValueDomainsInfeasible(self):
+        # two 1s side by side in the same region: a cell is left with no value
+        vals_list = ex_vals_list + (((0,0), 1), ((0,1), 1))
+        allowed = BlockPartySolver.valueDomains(vals_list, ex_grid, 5)
+        self.assertFalse(allowed.any(axis=1).all())
+
+        solver = BlockPartySolver(vals_list, ex_grid, False, keep_onehot=False)
+        self.assertEqual(solver.solutions, [])
+
+    def testBackendsAgree(self):
+        # the 10x10 puzzle with only its first 10 clues has several solutions
+        instances = ((ex_grid, ex_vals_list), (main.grid, main.vals_list), (main.grid, main.vals_list[:10]))
+        for grid, vals_list in instances:
+            expected = solutionSet(main.findSolution(grid, vals_list, True))
+            self.assertTrue(expected)
+            self.assertEqual(expected, solutionSet(main.findSolution(grid, vals_list, True, backend='propagate')))
+            solver = BlockPartySolver(vals_list, grid, True, keep_onehot=False, presolve=False)
+            self.assertEqual(expected, solutionSet(vals for vals, _ in solver.solutions))
+            # the one-hot arrays of the propagator match its values
+            propagator = BlockPartyPropagator(vals_list, grid, True)
+            for vals, X in propagator.solutions:
+                self.assertTrue((X.argmax(axis=-1) + 1 == vals).all())
+
+            for backend in ('cpsat', 'propagate'):
+                solutions = main.findSolution(grid, vals_list, backend=backend)
+                self.assertEqual(len(solutions), 1)
+                self.assertLessEqual(solutionSet(solutions), expected)
+
+    def testPropagateSingleProcess(self):
+        with self.assertRaises(ValueError):
+            main.findSolution(ex_grid, ex_vals_list, backend='propagate', nprocs=2)
+
+    def testTaxicabErrors(self):
+        rng = np.random.default_rng(0)
+        grids = [ex_vals, sol_vals]
+        # corrupted copies: a few cells changed to another value
+        for vals in (ex_vals, sol_vals):
+            for _ in range(5):
+                bad = vals.copy()
+                cells = rng.choice(bad.size, size=3, replace=False)
+                bad.flat[cells] = rng.integers(1, vals.max()+1, size=3)
+                grids.append(bad)
+        for vals in grids:
+            closer, missing = taxicabErrors(vals)
+            expected_closer, expected_missing = loopTaxicabErrors(vals)
+            self.assertTrue((closer == expected_closer).all())
+            self.assertTrue((missing == expected_missing).all())
+            self.assertEqual(bool(taxicabValid(vals)), not (expected_closer | expected_missing).any())
+        self.assertTrue(taxicabValid(ex_vals) and taxicabValid(sol_vals))
+        self.assertFalse(taxicabValid(np.array(grids[2:7])).any())
+
+        # a batch gives the same masks as one grid at a time
+        batch = np.array(grids[2:7])
+        closer, missing = taxicabErrors(batch)
+        for k, vals in enumerate(batch):
+            expected_closer, expected_missing = loopTaxicabErrors(vals)
+            self.assertTrue((closer[k] == expected_closer).all())
+            self.assertTrue((missing[k] == expected_missing).all())
+
+    def testEditorClues(self):
+        # clue toggles give the solutions of a fresh solver
+        for grid, vals_list in ((ex_grid, ex_vals_list), (main.grid, main.vals_list)):
+            editor = BlockPartyEditor(vals_list, grid)
+            self.assertTrue(editor.isUnique())
+            for ij, val in vals_list[:4]:
+                editor.removeClue(ij)
+                solutions = editor.solve(max_solutions=1000)
+                solver = BlockPartySolver([clue for clue in vals_list if clue[0] != ij], grid, True, keep_onehot=False)
+                self.assertEqual(solutionSet(solutions), solutionSet(vals for vals, _ in solver.solutions))
+                editor.setClue(ij, val)
+            self.assertEqual(solutionSet(editor.solve(max_solutions=1000)), solutionSet(main.findSolution(grid, vals_list, True)))
+
+    def testEditorRegions(self):
+        # region edits give the solutions of a fresh solver on the edited grid (moving a cell
+        # to a neighbouring region and back), and the model is rebuilt rather than growing
+        editor = BlockPartyEditor((), ex_grid, max_value=6, max_stale=4)
+        nconstraints = len(editor.model.Proto().constraints)
+        grid = ex_grid.copy()
+        moves = [((0,1), (0,2)), ((1,0), (0,0)), ((4,4), (4,3)), ((2,2), (2,3)), ((3,0), (4,1))]
+        for ij, ij2 in moves:
+            for g in (grid[ij2], grid[ij]):
+                grid[ij] = g
+                editor.setRegion(ij, g)
+                self.assertTrue((editor.grid == grid).all())
+                solutions = editor.solve(max_solutions=1000)
+                solver = BlockPartySolver((), grid, True, keep_onehot=False)
+                self.assertEqual(solutionSet(solutions), solutionSet(vals for vals, _ in solver.solutions))
+                self.assertLessEqual(editor.nstale, 4)
+        # back on the original grid
+        self.assertEqual(solutionSet(editor.solve(max_solutions=1000)), {tuple(ex_vals.flatten())})
+        self.assertGreater(editor.nbuilds, 1)
+        self.assertLess(len(editor.model.Proto().constraints), 2*nconstraints)
+
+    def testEditorRegionTooLarge(self):
+        # a rejected region edit leaves the editor as it was
+        editor = BlockPartyEditor(ex_vals_list, ex_grid)
+        self.assertEqual(editor.Nv, 5)
+        literals = dict(editor.region_active)
+        nconstraints = len(editor.model.Proto().constraints)
+        with self.assertRaises(ValueError):
+            editor.setRegion((0,2), 1) # region 1 already has 5 cells
+        self.assertTrue((editor.grid == ex_grid).all())
+        self.assertEqual(editor.region_active, literals)
+        self.assertEqual(editor.nstale, 0)
+        self.assertEqual(len(editor.model.Proto().constraints), nconstraints)
+        self.assertEqual(solutionSet(editor.solve(max_solutions=1000)), {tuple(ex_vals.flatten())})
+
+    def testFindSolutionCubes(self):
+        for grid, vals_list in ((ex_grid, ex_vals_list), (main.grid, main.vals_list), (main.grid, main.vals_list[:10])):
+            expected = solutionSet(main.findSolution(grid, vals_list, True))
+            self.assertEqual(expected, solutionSet(main.findSolution(grid, vals_list, nprocs=2, find_all_solutions=True)))
+            solutions = main.findSolution(grid, vals_list, nprocs=2)
+            self.assertEqual(len(solutions), 1)
+            self.assertLessEqual(solutionSet(solutions), expected)
+
+    def testCubes(self):
+        # the cubes split the search without losing or repeating solutions
+        vals_list = main.vals_list[:8]
+        expected = main.findSolution(main.grid, vals_list, True)
+        todo = main.cubes(main.grid, vals_list, 16)
+        self.assertGreater(len(todo), 1)
+        # no wall-clock stop by default: the same instance always gives the same cubes
+        self.assertEqual(main.cubes(main.grid, vals_list, 16), todo)
+        found = [vals for cube in todo for vals in main.solveCube(main.grid, cube, True)]
+        self.assertEqual(len(found), len(expected))
+        self.assertEqual(solutionSet(found), solutionSet(expected))
+        # the splitting stops after max_depth rounds
+        self.assertEqual(main.cubes(main.grid, vals_list, 16, max_depth=0), [vals_list])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+from ortools.sat.python import cp_model
+
+import numpy as np
+from itertools import product
+
+import logging
+import os
+import sys
+
+from NumberPlacementSolver import NumberPlacementModel
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionCallback import ArraySolutionCallback
+
+class HooksSolver(ArraySolutionCallback):
+    '''
+    Solves hook placement and number placement in a single CP-SAT model,
+    with the nested hook configuration as decision variables
+    '''
+    def __init__(self,
+                vals_list: tuple[tuple[int, int], int],
+                grid: np.ndarray,
+                find_all_solutions: bool,
+                num_search_workers: int = 0):
+        ArraySolutionCallback.__init__(self, keep_onehot=False)
+        self.find_all_solutions = find_all_solutions
+        self.num_search_workers = num_search_workers # 0 lets CP-SAT use all cores
+        self.solutions = []
+        self.nsolves = 0
+        status = self.solveHooks(vals_list, grid)
+
+        if status == cp_model.INFEASIBLE:
+            # print('No solution found')
+            pass
+        elif status == cp_model.FEASIBLE or status == cp_model.OPTIMAL:
+            logging.info(f'{len(self.solutions)} potential configurations found')
+
+    def assignSol(self, solver):
+        values = self.solutionValues(solver)
+        V = self.decodeOneHot(self.arrayValue('x', values))
+        M = self.arrayValue('m', values)
+        # a cell of hook h is inside the squares of sizes h..N-1
+        hook = self.N - self.arrayValue('ins', values).sum(axis=0, dtype=int)
+        return hook, V, M
+
+    def addHookPlacement(self, model, N):
+        '''
+        Nested hooks: the free region left after placing hooks N..n+1 is an n x n square
+        at offset (r0[n], c0[n]). Placing the corner of hook n shifts the square by (dr[n], dc[n]).
+        '''
+        dr = {n: model.NewBoolVar(f'dr[{n}]') for n in range(2, N+1)}
+        dc = {n: model.NewBoolVar(f'dc[{n}]') for n in range(2, N+1)}
+        self.corners = list(dr.values()) + list(dc.values())
+
+        # ins[n][r,c]: cell (r,c) is inside the n x n square (i.e. in a hook of size <= n)
+        ins = {}
+        for n in range(1, N):
+            ro = [model.NewBoolVar(f'ro[{n},{k}]') for k in range(N-n+1)] # one-hot row offset
+            co = [model.NewBoolVar(f'co[{n},{k}]') for k in range(N-n+1)] # one-hot col offset
+            model.AddExactlyOne(ro)
+            model.AddExactlyOne(co)
+            model.Add(sum(k*ro[k] for k in range(N-n+1)) == sum(dr[k] for k in range(n+1, N+1)))
+            model.Add(sum(k*co[k] for k in range(N-n+1)) == sum(dc[k] for k in range(n+1, N+1)))
+
+            ins[n] = {}
+            for r, c in product(range(N), range(N)):
+                rowin = sum(ro[k] for k in range(max(0, r-n+1), min(r, N-n)+1))
+                colin = sum(co[k] for k in range(max(0, c-n+1), min(c, N-n)+1))
+                b = model.NewBoolVar(f'ins[{n},{r},{c}]')
+                model.Add(b <= rowin)
+                model.Add(b <= colin)
+                model.Add(b >= rowin + colin - 1)
+                ins[n][r,c] = b
+        self.ins = ins
+        self.addArray('ins', (ins[n][r,c] for n in range(1, N) for r, c in product(range(N), range(N))), (N-1, N, N))
+
+        # hk(r,c,h): cell (r,c) belongs to hook h
+        def hk(r, c, h):
+            inner = ins[h-1][r,c] if h > 1 else 0
+            outer = ins[h][r,c] if h < N else 1
+            return outer - inner
+        return hk
+
+    def solveHooks(self, vals_list, grid):
+        base_model = NumberPlacementModel(vals_list, grid)
+        model = base_model.model
+        N = base_model.N
+        self.N = N
+        x = self.x = base_model.x
+        m = self.m = base_model.m
+        for name, (variables, shape) in base_model.solutionArrays().items():
+            self.addArray(name, variables, shape)
+
+        hk = self.addHookPlacement(model, N)
+
+        Nrange = [i+1 for i in range(N)] # (1 to N)
+        RC   = list(product(*[Nrange]*2))
+
+        # Value: a filled cell takes the value of its hook ...
+        for r,c in RC:
+            for h in Nrange:
+                for v in Nrange:
+                    model.Add(x[r,c,v] + hk(r-1,c-1,h) - 1 <= m[h,v])
+        # ... and a hook with value v has exactly v filled cells
+        for h in Nrange:
+            z = []
+            for r,c in RC:
+                b = model.NewBoolVar(f'z[{r},{c},{h}]')
+                filled = 1 - x[r,c,0]
+                model.Add(b <= filled)
+                model.Add(b <= hk(r-1,c-1,h))
+                model.Add(b >= filled + hk(r-1,c-1,h) - 1)
+                z.append(b)
+            model.Add(sum(z) == sum(v*m[h,v] for v in Nrange))
+
+        # SOLVE
+        solver = cp_model.CpSolver()
+        solver.parameters.num_search_workers = self.num_search_workers
+
+        # connectedness: re-solve with cuts until the placement is connected
+        while True:
+            status = solver.Solve(model)
+            self.nsolves += 1
+            if status not in (cp_model.FEASIBLE, cp_model.OPTIMAL):
+                break
+            hook, V, _ = self.assignSol(solver)
+            if base_model.addConnectivityCuts(model, V):
+                continue
+            self.solutions.append((hook, V))
+            if not self.find_all_solutions:
+                break
+            # exclude this hook configuration and placement and look for the next one
+            same = [b if solver.Value(b) else 1 - b for b in self.corners]
+            same += [x[r+1,c+1,v] for (r,c), v in np.ndenumerate(V)]
+            model.Add(sum(same) <= len(same) - 1)
+
+        return cp_model.FEASIBLE if self.solutions else status
@@ -2,53 +2,31 @@ from ortools.sat.python import cp_model
 
 import numpy as np
 from itertools import product
+from scipy.ndimage import label
 
 import logging
+import os
+import sys
 
-class NumberPlacementSolver(cp_model.CpSolverSolutionCallback):
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionCallback import ArraySolutionCallback
+
+class NumberPlacementModel:
     '''
-    Solves placement of numbers for some hook configuration
+    Hook-independent part of the number placement model, built once per puzzle and 
+    cloned for every hook configuration (only the "Value" block depends on the hook)
+
+    encoding: 'onehot' models cell values as x[r,c,v] and hook values as the permutation 
+        matrix m[h,v]; 'integer' uses one integer per hook (all different) and per cell, 
+        with a cell taking the value of its hook when filled
     '''
-    def __init__(self, 
-                vals_list: tuple[tuple[int, int], int], 
+    def __init__(self,
+                vals_list: tuple[tuple[int, int], int],
                 grid: np.ndarray,
-                hook: np.ndarray,
-                find_all_solutions: bool):
-        cp_model.CpSolverSolutionCallback.__init__(self)
-        self.find_all_solutions = find_all_solutions
-        self.solutions = []
-        status = self.solveNumberPlacement(vals_list, grid, hook)
-
-        if status == cp_model.INFEASIBLE:
-            # print('No solution found')
-            pass
-        elif status == cp_model.FEASIBLE or status == cp_model.OPTIMAL:
-            logging.info(f'{len(self.solutions)} potential configurations found')
-
-    def on_solution_callback(self):
-        solution = self.assignSol()
-        self.solutions.append(solution)
-
-    def assignSol(self):
-        N = self.N
-        x = self.x
-        m = self.m
-        X = np.zeros((N, N, N+1), dtype=int)
-        M = np.zeros((N, N+1), dtype=int)
-        V = np.zeros((N, N), dtype=int)
-        Nrange = [i+1 for i in range(N)] # (1 to N)
-        for r, c in product(Nrange, Nrange):
-            for v in range(N+1):
-                if self.Value(x[r,c,v]):
-                    X[r-1,c-1,v] = 1
-                    V[r-1,c-1] += v
-        for h,v in product(Nrange, range(N+1)):
-            if self.Value(m[h,v]):
-                M[h-1,v] = 1
-        return V, M, X
-
-    def solveNumberPlacement(self, vals_list, grid, hook):
+                encoding: str = 'onehot'):
         model = cp_model.CpModel()
+        self.model = model
+        self.encoding = encoding
 
         N, _ = grid.shape
         self.N = N # store N for convenience
@@ -61,6 +39,36 @@ class NumberPlacementSolver(cp_model.CpSolverSolutionCallback):
         Grange = [i+1 for i in range(ngrids)] # grid index
         RC   = list(product(*[Nrange]*2))
 
+        if encoding == 'onehot':
+            self.addOneHotVariables(Nrange, Vrange, RC)
+        elif encoding == 'integer':
+            self.addIntegerVariables(Nrange, RC)
+        else:
+            raise ValueError(f'Unknown encoding {encoding}')
+        filled = self.filled
+        value = self.value
+
+        ## SPARSITY constraint (one zero in every 2x2 submatrix)
+        for r,c in RC:
+            if r < N and c < N:
+                mat22 = (filled[r  ,c] + filled[r  ,c+1] +
+                         filled[r+1,c] + filled[r+1,c+1])
+                model.Add(mat22 <= 3)
+
+        # prescribed values
+        for (i,j), val in vals_list:
+            if encoding == 'onehot':
+                model.Add(self.x[i+1,j+1,val] == 1)
+            else:
+                model.Add(value[i+1,j+1] == val)
+        # correct grid sum
+        for g in Grange:
+            subgrid_sum = sum(value[r,c] for r,c in RC if grid[r-1,c-1] == g)
+            model.Add(subgrid_sum == gridsum_target)
+
+    def addOneHotVariables(self, Nrange, Vrange, RC):
+        model = self.model
+
         ## Define and save variables
         x = {}
         for r,c in RC:
@@ -72,6 +80,8 @@ class NumberPlacementSolver(cp_model.CpSolverSolutionCallback):
 
         self.x = x
         self.m = m
+        self.filled = {(r,c): sum(x[r,c,v] for v in Vrange if v > 0) for r,c in RC}
+        self.value = {(r,c): sum(v*x[r,c,v] for v in Vrange) for r,c in RC}
 
         ## UNIQUENESS constraints
         # each (r,c) has one unique v
@@ -85,30 +95,184 @@ class NumberPlacementSolver(cp_model.CpSolverSolutionCallback):
                 model.AddExactlyOne(m[h,v] for v in Vrange if v > 0)
                 model.Add(m[h,0] == 0)
 
-        ## SPARSITY constraint (one zero in every 2x2 submatrix)
+    def addIntegerVariables(self, Nrange, RC):
+        model = self.model
+        N = self.N
+
+        ## Define and save variables
+        hv = {h: model.NewIntVar(1, N, f'hv[{h}]') for h in Nrange} # value of hook h
+        cv = {(r,c): model.NewIntVar(0, N, f'cv[{r},{c}]') for r,c in RC} # value of cell (r,c)
+        nz = {(r,c): model.NewBoolVar(f'nz[{r},{c}]') for r,c in RC} # cell (r,c) is filled
+
+        self.hv = hv
+        self.filled = nz
+        self.value = cv
+
+        ## UNIQUENESS constraints
+        # hooks take distinct values
+        model.AddAllDifferent(hv.values())
+        # empty cells are 0
         for r,c in RC:
-            if r < N and c < N:
-                mat22 = (x[r  ,c,v] + x[r  ,c+1,v] +
-                        x[r+1,c,v] + x[r+1,c+1,v]
-                        for v in Vrange if v > 0)
-                model.Add(sum(mat22) <= 3)
+            model.Add(cv[r,c] == 0).OnlyEnforceIf(nz[r,c].Not())
+            model.Add(cv[r,c] >= 1).OnlyEnforceIf(nz[r,c])
+
+    def solutionArrays(self):
+        '''
+        Variables to read back from a solution, as name: (variables in C order, shape)
+        '''
+        N = self.N
+        if self.encoding == 'onehot':
+            return {'x': (self.x.values(), (N, N, N+1)), 'm': (self.m.values(), (N, N+1))}
+        return {'cv': (self.value.values(), (N, N)), 'hv': (self.hv.values(), (N,))}
+
+    def addConnectivityCuts(self, model, V):
+        '''
+        Cut off a placement whose filled cells are disconnected: every component S is smaller 
+        than the full set of filled cells, so whenever all of S is filled, a cell on the 
+        boundary of S must be filled too. Returns the number of cuts added (0 if connected).
+        '''
+        filled = self.filled
+        labels, ncomps = label(V)
+        if ncomps <= 1:
+            return 0
+        for k in range(1, ncomps+1):
+            S = labels == k
+            boundary = np.zeros_like(S)
+            boundary[1:,:] |= S[:-1,:]
+            boundary[:-1,:] |= S[1:,:]
+            boundary[:,1:] |= S[:,:-1]
+            boundary[:,:-1] |= S[:,1:]
+            boundary &= ~S
+            model.Add(sum(filled[r+1,c+1] for r, c in np.argwhere(boundary)) +
+                      sum(1 - filled[r+1,c+1] for r, c in np.argwhere(S)) >= 1)
+        return ncomps
+
+    def addHookConstraints(self, model, hook):
+        '''
+        Add the hook-dependent "Value" block to a clone of the base model.
+        Cells set to 0 in hook are a free region holding the hooks not placed yet (relaxation 
+        for partial configurations): value v appears v times there iff an unplaced hook has value v.
+        '''
+        N = self.N
+        unplaced = [h for h in range(1, N+1) if not (hook == h).any()]
+        RC_free = [(r+1, c+1) for r, c in np.argwhere(hook == 0)]
+
+        if self.encoding == 'integer':
+            # a filled cell takes the value of its hook, and hook h has hv[h] filled cells
+            hv, cv, nz = self.hv, self.value, self.filled
+            for h in range(1, N+1):
+                RC_h = [(r+1, c+1) for r, c in np.argwhere(hook == h)]
+                if not RC_h:
+                    continue
+                for r,c in RC_h:
+                    model.Add(cv[r,c] == hv[h]).OnlyEnforceIf(nz[r,c])
+                model.Add(sum(nz[r,c] for r,c in RC_h) == hv[h])
+            if RC_free:
+                model.Add(sum(nz[r,c] for r,c in RC_free) == sum(hv[h] for h in unplaced))
+            return
+
+        x = self.x
+        m = self.m
+        for h in range(1, N+1):
+            RC_h = [(r+1, c+1) for r, c in np.argwhere(hook == h)]
+            if not RC_h:
+                continue
+            for v in range(1, N+1):
+                model.Add(sum(x[r,c,v] for r,c in RC_h) == v*m[h,v])
+
+        if RC_free:
+            for v in range(1, N+1):
+                model.Add(sum(x[r,c,v] for r,c in RC_free) == v*sum(m[h,v] for h in unplaced))
+
+class NumberPlacementSolver(ArraySolutionCallback):
+    '''
+    Solves placement of numbers for some hook configuration
+    '''
+    def __init__(self, 
+                vals_list: tuple[tuple[int, int], int], 
+                grid: np.ndarray,
+                hook: np.ndarray,
+                find_all_solutions: bool,
+                num_search_workers: int = 0,
+                base_model: NumberPlacementModel = None,
+                connected: bool = True,
+                keep_onehot: bool = True,
+                hint: np.ndarray = None):
+        ArraySolutionCallback.__init__(self, keep_onehot)
+        self.hint = hint # (N, N) values to try first, e.g. the solution of a parent relaxation
+        self.find_all_solutions = find_all_solutions
+        self.num_search_workers = num_search_workers # 0 lets CP-SAT use all cores
+        self.connected = connected # only return placements with connected filled cells
+        self.solutions = []
+        self.nsolves = 0
+        if base_model is None:
+            base_model = NumberPlacementModel(vals_list, grid)
+        status = self.solveNumberPlacement(base_model, hook)
+
+        if status == cp_model.INFEASIBLE:
+            # print('No solution found')
+            pass
+        elif status == cp_model.FEASIBLE or status == cp_model.OPTIMAL:
+            logging.info(f'{len(self.solutions)} potential configurations found')
+
+    def on_solution_callback(self):
+        solution = self.assignSol()
+        self.solutions.append(solution)
+
+    def assignSol(self, solver=None):
+        '''
+        Read the solution from the callback, or from the solver after a search
+        '''
+        N = self.N
+        values = self.solutionValues(solver)
+        if self.base_model.encoding == 'onehot':
+            X = self.arrayValue('x', values)
+            V = self.decodeOneHot(X)
+            M = self.arrayValue('m', values)
+        else:
+            V = self.arrayValue('cv', values).astype(int)
+            X = self.encodeOneHot(V, N+1) if self.keep_onehot else None
+            M = self.encodeOneHot(self.arrayValue('hv', values), N+1)
+        return V, M, X if self.keep_onehot else None
+
+    def solveNumberPlacement(self, base_model, hook):
+        model = base_model.model.Clone()
+
+        self.N = base_model.N # store N for convenience
+        self.base_model = base_model
+        for name, (variables, shape) in base_model.solutionArrays().items():
+            self.addArray(name, variables, shape)
 
         # Value
-        for h in Nrange:
-            for v in Vrange:
-                if v > 0:
-                    model.Add(sum(x[r,c,v] for r,c in RC if hook[r-1,c-1] == h) == v*m[h,v])
+        base_model.addHookConstraints(model, hook)
 
-        # prescribed values
-        for (i,j), val in vals_list:
-            model.Add(x[i+1,j+1,val] == 1)
-        # correct grid sum
-        for g in Grange:
-            subgrid_sum = sum(v*x[r,c,v] for r,c in RC for v in Vrange if grid[r-1,c-1] == g)
-            model.Add(subgrid_sum == gridsum_target)
+        if self.hint is not None:
+            self.addHints(model, 'x' if base_model.encoding == 'onehot' else 'cv', self.hint)
 
         # SOLVE
         solver = cp_model.CpSolver()
-        solver.parameters.enumerate_all_solutions = self.find_all_solutions
-        status = solver.Solve(model, self)
-        return status
+        solver.parameters.num_search_workers = self.num_search_workers
+        if not self.connected:
+            solver.parameters.enumerate_all_solutions = self.find_all_solutions
+            self.nsolves = 1
+            return solver.Solve(model, self)
+
+        # connectedness: re-solve with cuts until the placement is connected
+        while True:
+            status = solver.Solve(model)
+            self.nsolves += 1
+            if status not in (cp_model.FEASIBLE, cp_model.OPTIMAL):
+                break
+            V, M, X = self.assignSol(solver)
+            if base_model.addConnectivityCuts(model, V):
+                continue
+            self.solutions.append((V, M, X))
+            if not self.find_all_solutions:
+                break
+            # exclude this placement and look for the next one (for a given hook
+            # configuration, the filled cells determine all the values)
+            filled = base_model.filled
+            model.Add(sum(filled[r+1,c+1] if v else 1 - filled[r+1,c+1]
+                          for (r,c), v in np.ndenumerate(V)) <= self.N**2 - 1)
+
+        return cp_model.FEASIBLE if self.solutions else status
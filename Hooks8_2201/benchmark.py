@@ -0,0 +1,45 @@
+import numpy as np
+import time
+import sys
+
+import main
+from NumberPlacementSolver import NumberPlacementModel
+from tests import ex_grid, ex_vals_list
+
+def benchmark(name, grid, vals_list, methods, nprocs=None):
+    '''
+    Time findSolution for each method on one instance
+    '''
+    print(f'====={name}=====')
+    for method in methods:
+        stats = {}
+        tstart = time.time()
+        # the tree search runs on a single process
+        solutions = main.findSolution(grid, vals_list, nprocs=1 if method == 'tree' else nprocs, method=method,
+                                      stats=stats)
+        elapsed = time.time() - tstart
+        area = main.computeSol(solutions[0][1])[0] if solutions else None
+        print(f'{method:>10}: {elapsed*1000:10.2f}ms, product {area}, {stats}')
+
+def benchmarkEncodings(name, grid, vals_list, method='tree'):
+    '''
+    Model size and solve time of the one-hot and integer number placement encodings
+    '''
+    print(f'====={name} encodings=====')
+    for encoding in ('onehot', 'integer'):
+        proto = NumberPlacementModel(vals_list, grid, encoding).model.Proto()
+        tstart = time.time()
+        solutions = main.findSolution(grid, vals_list, method=method, encoding=encoding)
+        elapsed = time.time() - tstart
+        area = main.computeSol(solutions[0][1])[0] if solutions else None
+        print(f'{encoding:>10}: {len(proto.variables):6d} variables, {len(proto.constraints):6d} constraints, '
+              f'{elapsed*1000:10.2f}ms, product {area}')
+
+if __name__ == '__main__':
+    # the 9x9 sweep takes minutes even on all cores, pass "quick" to skip it
+    methods = ['enumerate', 'monolithic', 'tree']
+    benchmark('example 5x5', ex_grid, ex_vals_list, methods)
+    benchmarkEncodings('example 5x5', ex_grid, ex_vals_list)
+    if 'quick' not in sys.argv:
+        benchmark('puzzle 9x9', np.array(main.grid, dtype=int), main.vals_list, methods)
+        benchmarkEncodings('puzzle 9x9', np.array(main.grid, dtype=int), main.vals_list)
@@ -2,12 +2,17 @@ import numpy as np
 from scipy.ndimage import label
 import time
 import logging
+import multiprocessing
+import os
+import sys
 
-from NumberPlacementSolver import NumberPlacementSolver
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-logging.basicConfig(filename='hooks8.log', filemode='w',
-    level=logging.INFO,
-    format='[%(levelname)s] %(message)s')
+from NumberPlacementSolver import NumberPlacementSolver, NumberPlacementModel
+from HooksSolver import HooksSolver
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SweepCheckpoint import SweepCheckpoint
 
 vals_list = [
     ((0,2), 8)
@@ -91,28 +96,444 @@ def checkConnected(vals):
     _, ncomps = label(vals)
     return ncomps==1
 
-def findSolution(grid, vals_list, find_all_solutions = False):
-    N, _ = grid.shape
-    hook = np.zeros((N,N), dtype=int)
+# shift of the free square after placing the corner of a hook:
+# top-left, bot-left, top-right, bot-right (same order as validHooks)
+CORNER_SHIFTS = np.array([[1,1], [0,1], [1,0], [0,0]], dtype=int)
+
+def hookLayouts(N, start=0, stop=None):
+    '''
+    Hook configurations start..stop-1, in the order of allValidHooks, as one (H,N,N) int8 array.
+    Configuration k is encoded by its corner choices as base-4 digits (outermost hook most 
+    significant). The free region is always a square, so its offset is all the state needed.
+    '''
+    total = 4**(N-1)
+    stop = total if stop is None else min(stop, total)
+    k = np.arange(start, stop)
+    H = len(k)
+    hooks = np.full((H,N,N), N, dtype=np.int8)
+    r0 = np.zeros((H,1), dtype=int)
+    c0 = np.zeros((H,1), dtype=int)
+    idx = np.arange(N)
+    for n in range(N, 1, -1):
+        shift = CORNER_SHIFTS[(k // 4**(n-2)) % 4]
+        r0 += shift[:,:1]
+        c0 += shift[:,1:]
+        # cells of the remaining (n-1)x(n-1) square belong to a smaller hook
+        rows = (idx >= r0) & (idx < r0+n-1)
+        cols = (idx >= c0) & (idx < c0+n-1)
+        hooks -= rows[:,:,None] & cols[:,None,:]
+    return hooks
+
+def hookRanges(N, batchsize, swept=None):
+    '''
+    Index ranges of hook configurations, skipping ranges already done (from a checkpoint)
+    '''
+    total = 4**(N-1)
+    for start in range(0, total, batchsize):
+        stop = min(start+batchsize, total)
+        if swept is None or not swept[start:stop].all():
+            yield start, stop
+
+def loadCheckpoint(checkpoint, N, stats):
+    '''
+    Hook configurations already swept and the solutions they produced
+    '''
+    swept = np.zeros(4**(N-1), dtype=bool)
     solutions = []
+    for (start, stop), result in checkpoint.items.items():
+        swept[start:stop] = True
+        solutions += [(np.array(hook, dtype=np.int8), np.array(vals, dtype=int)) for hook, vals in result]
+    stats['resumed'] = int(swept.sum())
+    logging.info(f'Resuming from {checkpoint.path}: {stats["resumed"]} hook configurations already swept')
+    return swept, solutions
+
+def partialHookLayout(N, corners):
+    '''
+    Hook configuration with the outer hooks N, N-1, ... placed by the given corner choices
+    (indices into CORNER_SHIFTS); the free square left inside is 0, or hook 1 once all placed.
+    '''
+    hook = np.zeros((N,N), dtype=np.int8)
+    r0 = c0 = 0
+    for n, corner in zip(range(N, 1, -1), corners):
+        hook[r0:r0+n, c0:c0+n] = n
+        r0 += CORNER_SHIFTS[corner,0]
+        c0 += CORNER_SHIFTS[corner,1]
+    n = N - len(corners)
+    hook[r0:r0+n, c0:c0+n] = 1 if n == 1 else 0
+    return hook
+
+def dihedralTransforms():
+    '''
+    The 8 symmetries of the square board, acting on the last two axes of an array
+    '''
+    return [lambda a, k=k, flip=flip: np.rot90(np.swapaxes(a, -1, -2) if flip else a, k, axes=(-2,-1))
+            for flip in (False, True) for k in range(4)]
+
+def relabelGrid(grid):
+    '''
+    Relabel regions in order of first appearance, so equal partitions compare equal
+    '''
+    _, first, inverse = np.unique(grid, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    return order[inverse].reshape(grid.shape)
+
+def instanceSymmetries(grid, vals_list):
+    '''
+    Transforms of the board mapping the puzzle (regions and prescribed values) onto itself.
+    Always contains the identity.
+    '''
+    vals = np.zeros_like(grid)
+    for (i,j), val in vals_list:
+        vals[i,j] = val
+    canon = relabelGrid(grid)
+    return [T for T in dihedralTransforms()
+            if (relabelGrid(T(grid)) == canon).all() and (T(vals) == vals).all()]
+
+def canonicalMask(hooks, syms):
+    '''
+    True for hook configurations that are the (lexicographically) smallest member of their orbit
+    under the symmetries of the instance; the others have the same solutions up to symmetry.
+    '''
+    H = len(hooks)
+    rows = np.arange(H)
+    flat = hooks.reshape(H, -1)
+    canonical = np.ones(H, dtype=bool)
+    for T in syms:
+        other = T(hooks).reshape(H, -1)
+        diff = other != flat
+        first = diff.argmax(axis=1)
+        canonical &= ~(diff.any(axis=1) & (other[rows, first] < flat[rows, first]))
+    return canonical
+
+def expandSymmetricSolutions(solutions, syms):
+    '''
+    Recover the solutions of the skipped hook configurations by applying the symmetries
+    '''
+    expanded = {}
+    for hook, vals in solutions:
+        for T in syms:
+            new_hook, new_vals = T(hook).copy(), T(vals).copy()
+            expanded.setdefault((new_hook.tobytes(), new_vals.tobytes()), (new_hook, new_vals))
+    return list(expanded.values())
+
+def prefilterHooks(hooks, grid, vals_list):
+    '''
+    Cheap necessary conditions checked on a whole (H,N,N) batch of hook configurations at once.
+    Returns a mask of the configurations that may still have a solution.
+    - a hook h has 2h-1 cells, so it can only hold values up to 2h-1
+    - prescribed values share a hook if and only if they are equal
+    - every region sum must be reachable given the hooks crossing the region
+    '''
+    H, N, _ = hooks.shape
+    ngrids = grid.max()
+    gridsum_target = N*(N+1)*(2*N+1)//(6*ngrids)
+    rows = np.arange(H)
+    keep = np.ones(H, dtype=bool)
 
-    for i, new_hook in enumerate(allValidHooks(hook, N)):
+    # value known for each hook from the prescribed values (0 if unknown)
+    known = np.zeros((H,N), dtype=int)
+    for k, ((i,j), val) in enumerate(vals_list):
+        h = hooks[:,i,j].astype(int)
+        keep &= val <= 2*h-1
+        known[rows, h-1] = val
+        for (i2,j2), val2 in vals_list[:k]:
+            same_hook = h == hooks[:,i2,j2]
+            keep &= same_hook if val == val2 else ~same_hook
+
+    # bounds on the value of hooks without a prescribed value
+    sizes = 2*np.arange(1, N+1) - 1
+    free_vals = sorted(set(range(1, N+1)) - {val for _, val in vals_list})
+    max_free = np.array([max([v for v in free_vals if v <= size], default=0) for size in sizes])
+    min_free = min(free_vals, default=0)
+    upper = np.where(known > 0, known, max_free) # (H,N)
+    lower = np.where(known > 0, known, min_free)
+    keep &= (upper > 0).all(axis=1)
+
+    # number of (prescribed) cells of each hook in each region
+    hook_onehot = hooks.reshape(H,1,N*N) == np.arange(1, N+1).reshape(1,N,1) # (H,N,N^2)
+    grid_onehot = grid.reshape(N*N,1) == np.arange(1, ngrids+1).reshape(1,ngrids) # (N^2,G)
+    prescribed = np.zeros(N*N, dtype=int)
+    for (i,j), _ in vals_list:
+        prescribed[i*N+j] = 1
+    cnt = hook_onehot.astype(int) @ grid_onehot # (H,N,G)
+    pcnt = (hook_onehot*prescribed).astype(int) @ grid_onehot
+    outside = sizes.reshape(1,N,1) - cnt
+
+    # hook h holds exactly v_h filled cells, each worth v_h
+    upper, lower = upper[:,:,None], lower[:,:,None]
+    max_sum = (upper*np.minimum(cnt, upper)).sum(axis=1) # (H,G)
+    min_sum = (lower*np.maximum(pcnt, lower-outside)).sum(axis=1)
+    keep &= (max_sum >= gridsum_target).all(axis=1)
+    keep &= (min_sum <= gridsum_target).all(axis=1)
+    return keep
+
+def addStats(stats, new):
+    for key, val in new.items():
+        stats[key] = stats.get(key, 0) + val
+
+def prepareHookBatch(grid, vals_list, start, stop, syms, prefilter, stats):
+    '''
+    Generate a batch of hook configurations and drop the ones that need not be solved.
+    Returns the indices of the remaining configurations and the configurations.
+    '''
+    N, _ = grid.shape
+    hooks = hookLayouts(N, start, stop)
+    indices = np.arange(start, stop)
+    if len(syms) > 1:
+        keep = canonicalMask(hooks, syms)
+        addStats(stats, {'symmetry_skipped': int((~keep).sum())})
+        hooks, indices = hooks[keep], indices[keep]
+    if prefilter:
+        keep = prefilterHooks(hooks, grid, vals_list)
+        addStats(stats, {'prefilter_rejected': int((~keep).sum())})
+        hooks, indices = hooks[keep], indices[keep]
+    return indices, hooks
+
+def solveHooks(indices, hooks, grid, vals_list, base_model, find_all_solutions,
+               num_search_workers = 0, stop_event = None):
+    '''
+    Solve the number placement for a batch of hook configurations.
+    Stops early once a solution is found (first-solution mode), by any worker if stop_event is given.
+    '''
+    solutions = []
+    for i, hook in zip(indices, hooks):
+        if stop_event is not None and stop_event.is_set():
+            break
         tstart = time.time()
-        NPSolver = NumberPlacementSolver(vals_list, grid, new_hook, find_all_solutions)
+        NPSolver = NumberPlacementSolver(vals_list, grid, hook, find_all_solutions,
+                                         num_search_workers=num_search_workers, base_model=base_model,
+                                         keep_onehot=False)
 
         for vals, _, _ in NPSolver.solutions:
             if checkConnected(vals):
-                solutions.append((new_hook, vals))
+                solutions.append((hook, vals))
                 if not find_all_solutions:
+                    if stop_event is not None:
+                        stop_event.set()
                     return solutions
 
         logging.debug(f'Testing hook {i}: {(time.time() - tstart)*1000:.2f}ms elapsed, found {len(solutions)} solutions')
 
     return solutions
 
-def main(grid, vals_list):
+# set in worker processes of the parallel sweep
+_stop_event = None
+_grid = None
+_vals_list = None
+_syms = None
+_prefilter = None
+_base_model = None
+
+def initWorker(stop_event, grid, vals_list, symmetry, prefilter, encoding):
+    '''
+    Each worker builds the hook-independent model once and reuses it for every batch
+    '''
+    global _stop_event, _grid, _vals_list, _syms, _prefilter, _base_model
+    _stop_event = stop_event
+    _grid = grid
+    _vals_list = vals_list
+    _syms = instanceSymmetries(grid, vals_list) if symmetry else []
+    _prefilter = prefilter
+    _base_model = NumberPlacementModel(vals_list, grid, encoding)
+
+def solveHookRange(start, stop, find_all_solutions):
+    '''
+    Worker task: generate hook configurations start..stop-1 and solve them on a single core
+    '''
+    stats = {}
+    indices, hooks = prepareHookBatch(_grid, _vals_list, start, stop, _syms, _prefilter, stats)
+    solutions = solveHooks(indices, hooks, _grid, _vals_list, _base_model, find_all_solutions,
+                           num_search_workers=1, stop_event=_stop_event)
+    # a range interrupted by another worker's solution is not finished
+    complete = bool(solutions) or not _stop_event.is_set()
+    return solutions, stats, complete
+
+def findSolutionParallel(grid, vals_list, find_all_solutions, symmetry, prefilter, stats, checkpoint, encoding,
+                         nprocs = None, batchsize = 64):
+    '''
+    Sweep the hook configurations over a process pool. Workers are only sent index ranges and 
+    generate the configurations themselves. In first-solution mode the remaining work is 
+    cancelled once a solution is found.
+    '''
+    N, _ = grid.shape
+    nprocs = nprocs or multiprocessing.cpu_count()
+    swept, solutions = loadCheckpoint(checkpoint, N, stats) if checkpoint is not None else (None, [])
+    if solutions and not find_all_solutions:
+        return solutions[:1]
+    ranges = hookRanges(N, batchsize, swept)
+    batch_solutions = {}
+
+    stop_event = multiprocessing.Event()
+    with ProcessPoolExecutor(nprocs, initializer=initWorker,
+                             initargs=(stop_event, grid, vals_list, symmetry, prefilter, encoding)) as executor:
+        pending = {}
+        while True:
+            # keep a bounded number of batches in flight
+            while len(pending) < 2*nprocs and not stop_event.is_set():
+                start_stop = next(ranges, None)
+                if start_stop is None:
+                    break
+                future = executor.submit(solveHookRange, *start_stop, find_all_solutions)
+                pending[future] = start_stop
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, stop = pending.pop(future)
+                batch_solutions[start], batch_stats, complete = future.result()
+                addStats(stats, batch_stats)
+                logging.debug(f'Finished hooks {start}..{stop-1}, found {len(batch_solutions[start])} solutions')
+                if checkpoint is not None and complete:
+                    checkpoint.record((start, stop), batch_solutions[start])
+                if batch_solutions[start] and not find_all_solutions:
+                    stop_event.set()
+
+            if stop_event.is_set():
+                executor.shutdown(wait=True, cancel_futures=True)
+                break
+
+    solutions += [sol for start in sorted(batch_solutions) for sol in batch_solutions[start]]
+    return uniqueSolutions(solutions) if find_all_solutions else solutions[:1]
+
+def findSolutionSerial(grid, vals_list, find_all_solutions, syms, prefilter, stats, checkpoint, encoding, batchsize = 1024):
+    N, _ = grid.shape
+    swept, solutions = loadCheckpoint(checkpoint, N, stats) if checkpoint is not None else (None, [])
+    if solutions and not find_all_solutions:
+        return solutions[:1]
+    base_model = NumberPlacementModel(vals_list, grid, encoding)
+
+    for start, stop in hookRanges(N, batchsize, swept):
+        indices, hooks = prepareHookBatch(grid, vals_list, start, stop, syms, prefilter, stats)
+        batch_solutions = solveHooks(indices, hooks, grid, vals_list, base_model, find_all_solutions)
+        if checkpoint is not None:
+            checkpoint.record((start, stop), batch_solutions)
+        solutions += batch_solutions
+        if solutions and not find_all_solutions:
+            break
+
+    return uniqueSolutions(solutions)
+
+def uniqueSolutions(solutions):
+    '''
+    Ranges partially covered by a checkpoint are swept again, drop the repeated solutions
+    '''
+    unique = {}
+    for hook, vals in solutions:
+        unique.setdefault((hook.tobytes(), vals.tobytes()), (hook, vals))
+    return list(unique.values())
+
+def findSolutionTree(grid, vals_list, find_all_solutions, stats, nogoods = None, encoding = 'onehot', hints = False):
+    '''
+    Place the hooks from the outside in, solving a relaxation of the number placement for every 
+    partial configuration (inner hooks free) and pruning the whole subtree when it is infeasible.
+    nogoods: set of corner prefixes known to be infeasible, updated in place and reusable 
+        across calls for the same puzzle
+    hints: warm-start every relaxation with the values found for its parent
+    '''
+    N, _ = grid.shape
+    nogoods = set() if nogoods is None else nogoods
+    base_model = NumberPlacementModel(vals_list, grid, encoding)
+    solutions = []
+    addStats(stats, {'tree_nodes': 0, 'tree_pruned': 0, 'solver_calls': 0, 'hinted_calls': 0})
+
+    def search(corners, hint):
+        hook = partialHookLayout(N, corners)
+        leaf = len(corners) == N-1
+        stats['tree_nodes'] += 1
+        if tuple(corners) in nogoods:
+            feasible = False
+        elif not corners:
+            feasible = True # nothing placed, the relaxation is the whole puzzle
+        else:
+            # connectedness is left to the leaves, the cuts converge slowly on loose relaxations
+            NPSolver = NumberPlacementSolver(vals_list, grid, hook, find_all_solutions and leaf,
+                                             base_model=base_model, connected=leaf, keep_onehot=False,
+                                             hint=hint if hints else None)
+            stats['solver_calls'] += 1
+            stats['hinted_calls'] += hints and hint is not None
+            feasible = bool(NPSolver.solutions)
+            if feasible:
+                hint = NPSolver.solutions[0][0]
+
+        if not feasible:
+            nogoods.add(tuple(corners))
+            stats['tree_pruned'] += 4**(N-1-len(corners)) # configurations in the subtree
+            return False
+        if leaf:
+            solutions.extend((hook, vals) for vals, _, _ in NPSolver.solutions)
+            return not find_all_solutions
+        for corner in range(len(CORNER_SHIFTS)):
+            if search(corners + [corner], hint):
+                return True
+        return False
+
+    search([], None)
+    logging.info(f'Tree search: {stats["solver_calls"]} solver calls, {stats["tree_pruned"]} hook configurations pruned')
+    return solutions
+
+def findSolution(grid, vals_list, find_all_solutions = False, nprocs = 1, symmetry = False, prefilter = None, stats = None,
+                 method = 'enumerate', checkpoint = None, encoding = 'onehot', hints = False):
+    '''
+    method: 'enumerate' sweeps the hook configurations and solves the number placement for each,
+        'monolithic' solves hook and number placement in a single CP-SAT model (HooksSolver),
+        'tree' places the hooks from the outside in and prunes infeasible partial configurations
+    nprocs: number of worker processes for the hook sweep, or CP-SAT search workers 
+        for the monolithic model (None for all cores)
+    symmetry: only solve one hook configuration per orbit of the board symmetries 
+        that leave the puzzle unchanged
+    prefilter: drop hook configurations failing cheap necessary conditions before solving
+        (enumerate only, on by default)
+    stats: optional dict, filled with counts about the sweep
+    checkpoint: optional path of an append-only file recording the finished hook ranges,
+        an interrupted sweep resumes from it
+    encoding: 'onehot' or 'integer' variables for the number placement (see NumberPlacementModel)
+    hints: tree search only, warm-start each partial configuration with the values found for its parent
+    Options the method does not support raise a ValueError. The hooks are returned as int8 by every method.
+    '''
+    stats = {} if stats is None else stats
+    if method == 'monolithic':
+        if symmetry or prefilter or checkpoint is not None or encoding != 'onehot' or hints:
+            raise ValueError('the monolithic model takes no symmetry, prefilter, checkpoint, encoding or hints')
+        solver = HooksSolver(vals_list, grid, find_all_solutions, num_search_workers=nprocs or 0)
+        stats['solver_calls'] = solver.nsolves
+        # same hook dtype as the hook layouts of the other methods
+        return [(hook.astype(np.int8), vals) for hook, vals in solver.solutions]
+    elif method == 'tree':
+        if nprocs != 1 or symmetry or prefilter or checkpoint is not None:
+            raise ValueError('tree search runs on a single process, without symmetry, prefilter or checkpoint')
+        return findSolutionTree(grid, vals_list, find_all_solutions, stats, encoding=encoding, hints=hints)
+    elif method != 'enumerate':
+        raise ValueError(f'Unknown method {method}')
+    if hints:
+        raise ValueError('hints need the tree search')
+    prefilter = True if prefilter is None else prefilter
+
+    syms = instanceSymmetries(grid, vals_list) if symmetry else []
+    if checkpoint is not None:
+        checkpoint = SweepCheckpoint(checkpoint, (grid, vals_list, find_all_solutions, symmetry))
+
+    if nprocs != 1:
+        solutions = findSolutionParallel(grid, vals_list, find_all_solutions, symmetry, prefilter, stats, checkpoint, encoding, nprocs)
+    else:
+        solutions = findSolutionSerial(grid, vals_list, find_all_solutions, syms, prefilter, stats, checkpoint, encoding)
+
+    if prefilter:
+        stats.setdefault('prefilter_rejected', 0)
+        logging.info(f'{stats["prefilter_rejected"]} hook configurations rejected before solving')
+
+    if symmetry:
+        stats['symmetries'] = len(syms)
+        stats.setdefault('symmetry_skipped', 0)
+        logging.info(f'{len(syms)} board symmetries, {stats["symmetry_skipped"]} solver calls avoided')
+    if len(syms) > 1 and find_all_solutions:
+        solutions = expandSymmetricSolutions(solutions, syms)
+
+    return solutions
+
+def main(grid, vals_list, nprocs = 1):
     tstart = time.time()
-    solutions = findSolution(grid, vals_list)
+    solutions = findSolution(grid, vals_list, nprocs=nprocs)
     print(f'Total time: {(time.time() - tstart)*1000: .2f}ms')
 
     if not solutions:
@@ -133,6 +554,10 @@ def main(grid, vals_list):
 
 
 if __name__ == '__main__':
-    main(np.array(grid, dtype=int), vals_list)
+    # only the parent process writes the log: spawned workers re-import this module
+    logging.basicConfig(filename='hooks8.log', filemode='w',
+        level=logging.INFO,
+        format='[%(levelname)s] %(message)s')
+    main(np.array(grid, dtype=int), vals_list, nprocs=None)
     # from tests import ex_grid, ex_vals_list, ex_hook, ex_vals
     # main(ex_grid, ex_vals_list)
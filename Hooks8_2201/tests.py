@@ -1,9 +1,12 @@
 
 import main
+from NumberPlacementSolver import NumberPlacementSolver, NumberPlacementModel
 
 import numpy as np
 import matplotlib.pyplot as plt
 
+import os
+import tempfile
 import unittest
 
 ex_N = 5
@@ -82,6 +85,27 @@ class TestSetup(unittest.TestCase):
         self.assertEqual(count, expected_count) # should be 4^(N-1) total configs
         self.assertTrue(arr1_found and arr2_found and ex_found)
 
+    def testHookLayouts(self):
+        hook = np.zeros((ex_N, ex_N), dtype=int)
+        expected = np.array(list(main.allValidHooks(hook, ex_N)))
+
+        hooks = main.hookLayouts(ex_N)
+        self.assertEqual(hooks.shape, (4**(ex_N-1), ex_N, ex_N))
+        self.assertEqual(hooks.dtype, np.int8)
+        self.assertTrue((hooks == expected).all())
+        self.assertTrue((main.hookLayouts(ex_N, 100, 120) == expected[100:120]).all())
+
+    def testPrefilterHooks(self):
+        hooks = main.hookLayouts(ex_N)
+        keep = main.prefilterHooks(hooks, ex_grid, ex_vals_list)
+        self.assertTrue(main.prefilterHooks(ex_hook[None], ex_grid, ex_vals_list).all())
+
+        # only hook configurations without any number placement are rejected
+        base_model = NumberPlacementModel(ex_vals_list, ex_grid)
+        for hook in hooks[~keep]:
+            NPSolver = NumberPlacementSolver(ex_vals_list, ex_grid, hook, False, base_model=base_model)
+            self.assertFalse(NPSolver.solutions)
+
     def testFindSolution(self):
         solutions = main.findSolution(ex_grid, ex_vals_list)
         self.assertEqual(len(solutions), 1)
@@ -92,6 +116,124 @@ class TestSetup(unittest.TestCase):
 
         area, _ = main.computeSol(vals)
         self.assertEqual(area, 12)
+
+    def testBaseModelReuse(self):
+        base_model = NumberPlacementModel(ex_vals_list, ex_grid)
+        nconstraints = len(base_model.model.Proto().constraints)
+        for hook in (ex_wrong_hook, ex_hook):
+            reused = NumberPlacementSolver(ex_vals_list, ex_grid, hook, True, base_model=base_model)
+            fresh = NumberPlacementSolver(ex_vals_list, ex_grid, hook, True)
+            self.assertEqual(len(reused.solutions), len(fresh.solutions))
+        # cloning leaves the base model untouched
+        self.assertEqual(len(base_model.model.Proto().constraints), nconstraints)
+        self.assertTrue(any((vals == ex_vals).all() for vals, _, _ in reused.solutions))
+
+    def testSymmetricHooks(self):
+        # one region and no prescribed values: invariant under all 8 board symmetries
+        grid = np.ones((3,3), dtype=int)
+        self.assertEqual(len(main.instanceSymmetries(grid, [])), 8)
+        self.assertEqual(len(main.instanceSymmetries(ex_grid, ex_vals_list)), 1)
+
+        stats = {}
+        solutions = main.findSolution(grid, [], find_all_solutions=True, symmetry=True, stats=stats)
+        expected = main.findSolution(grid, [], find_all_solutions=True)
+        self.assertEqual(stats['symmetry_skipped'], 13) # 3 of the 16 hook configurations are solved
+        self.assertEqual(sorted((h.tobytes(), v.tobytes()) for h, v in solutions),
+                         sorted((h.tobytes(), v.tobytes()) for h, v in expected))
+
+    def testFindSolutionMonolithic(self):
+        for find_all_solutions in (False, True):
+            solutions = main.findSolution(ex_grid, ex_vals_list, find_all_solutions, method='monolithic')
+            self.assertEqual(len(solutions), 1)
+
+            hook, vals = solutions.pop()
+            self.assertTrue((hook == ex_hook).all())
+            self.assertTrue((vals == ex_vals).all())
+
+    def testUnsupportedOptions(self):
+        with self.assertRaises(ValueError):
+            main.findSolution(ex_grid, ex_vals_list, method='tree', symmetry=True)
+        with self.assertRaises(ValueError):
+            main.findSolution(ex_grid, ex_vals_list, method='tree', nprocs=2)
+        with self.assertRaises(ValueError):
+            main.findSolution(ex_grid, ex_vals_list, hints=True)
+        for option in ({'symmetry': True}, {'prefilter': True}, {'checkpoint': 'unused.ckpt'},
+                       {'encoding': 'integer'}):
+            with self.assertRaises(ValueError):
+                main.findSolution(ex_grid, ex_vals_list, method='monolithic', **option)
+        for method in ('enumerate', 'tree', 'monolithic'):
+            hook, _ = main.findSolution(ex_grid, ex_vals_list, method=method)[0]
+            self.assertEqual(hook.dtype, np.int8)
+
+    def testIntegerEncoding(self):
+        for method in ('enumerate', 'tree'):
+            solutions = main.findSolution(ex_grid, ex_vals_list, True, method=method, encoding='integer')
+            self.assertEqual(len(solutions), 1)
+
+            hook, vals = solutions.pop()
+            self.assertTrue((hook == ex_hook).all())
+            self.assertTrue((vals == ex_vals).all())
+
+    def testFindSolutionCheckpoint(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'hooks8.ckpt')
+            expected = main.findSolution(ex_grid, ex_vals_list, True, checkpoint=path)
+            lines = open(path).readlines()
+
+            # interrupted while writing the last batch
+            with open(path, 'w') as f:
+                f.writelines(lines[:-1] + [lines[-1][:10]])
+            stats = {}
+            solutions = main.findSolution(ex_grid, ex_vals_list, True, checkpoint=path, stats=stats)
+            self.assertEqual(stats['resumed'], 0)
+            self.assertEqual(open(path).readlines(), lines)
+            self.assertEqual(len(solutions), len(expected))
+
+            # fully swept: nothing left to solve
+            stats = {}
+            solutions = main.findSolution(ex_grid, ex_vals_list, True, checkpoint=path, stats=stats)
+            self.assertEqual(stats['resumed'], 4**(ex_N-1))
+            hook, vals = solutions.pop()
+            self.assertTrue((hook == ex_hook).all())
+            self.assertTrue((vals == ex_vals).all())
+
+    def testFindSolutionTree(self):
+        for find_all_solutions in (False, True):
+            stats = {}
+            solutions = main.findSolution(ex_grid, ex_vals_list, find_all_solutions, method='tree', stats=stats)
+            self.assertEqual(len(solutions), 1)
+            self.assertLess(stats['solver_calls'], 4**(ex_N-1))
+
+            hook, vals = solutions.pop()
+            self.assertTrue((hook == ex_hook).all())
+            self.assertTrue((vals == ex_vals).all())
+
+        # infeasible prefixes are not solved again
+        nogoods = set()
+        main.findSolutionTree(ex_grid, ex_vals_list, True, {}, nogoods)
+        stats = {}
+        main.findSolutionTree(ex_grid, ex_vals_list, True, stats, nogoods)
+        self.assertEqual(stats['solver_calls'], 1 + (ex_N-2)) # the path to the solution only
+
+    def testFindSolutionTreeHints(self):
+        for encoding in ('onehot', 'integer'):
+            stats = {}
+            solutions = main.findSolution(ex_grid, ex_vals_list, True, method='tree', stats=stats,
+                                          encoding=encoding, hints=True)
+            self.assertEqual(len(solutions), 1)
+            self.assertGreater(stats['hinted_calls'], 0)
+
+            hook, vals = solutions.pop()
+            self.assertTrue((hook == ex_hook).all())
+            self.assertTrue((vals == ex_vals).all())
+
+    def testFindSolutionParallel(self):
+        solutions = main.findSolution(ex_grid, ex_vals_list, find_all_solutions=True, nprocs=2)
+        self.assertEqual(len(solutions), 1)
+
+        hook, vals = solutions.pop()
+        self.assertTrue((hook == ex_hook).all())
+        self.assertTrue((vals == ex_vals).all())
         
 def checkGrid(grid=main.grid):
         fig, ax = plt.subplots()
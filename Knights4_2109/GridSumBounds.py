@@ -0,0 +1,139 @@
+import numpy as np
+
+def pathLength(gridsum_target, ngrids, max_length=None):
+    '''
+    Number of steps K with 1+2+...+K = ngrids*gridsum_target, None if there is none
+    (or if K is above the optional max_length, e.g. the number of squares)
+    '''
+    total = int(gridsum_target)*ngrids
+    K = int(round(((8*total + 1)**0.5 - 1)/2))
+    if K*(K+1)//2 != total or (max_length is not None and K > max_length):
+        return None
+    return K
+
+def topSum(values, m):
+    '''
+    Largest sum of at most m of the (distinct) values
+    '''
+    return sum(sorted(values, reverse=True)[:max(m, 0)])
+
+def subsetSums(values, m):
+    '''
+    sums[k]: set of the sums of k distinct values, for k <= m
+    '''
+    sums = [{0}] + [set() for _ in range(m)]
+    for v in values:
+        for k in range(m, 0, -1):
+            sums[k] |= {t + v for t in sums[k-1]}
+    return sums
+
+def rejectGridSum(grid, vals_list, gridsum_target):
+    '''
+    Reason why no knight's path can give every region the sum gridsum_target, or None
+    if the bounds below cannot rule it out:
+    * the regions sum to 1+2+...+K for a path of K steps, with K covering the prescribed values
+    * knight's moves alternate square colours, so odd and even steps sit on opposite colours,
+        fixed by the prescribed values when there are any
+    * in every region, the prescribed values must not exceed the target, and the rest of the
+        target must be a sum of free values of the right parity that fit on its free squares 
+        of each colour (values shared between regions are not accounted for)
+    '''
+    N, _ = grid.shape
+    ngrids = grid.max()
+    target = int(gridsum_target)
+
+    K = pathLength(target, ngrids)
+    if K is None:
+        return f'{ngrids} regions summing to {target} is not a sum 1+2+...+K'
+    if K > N**2:
+        return f'a path of {K} steps does not fit on the board'
+    if vals_list and K < max(val for _, val in vals_list):
+        return f'a path of {K} steps misses the prescribed value {max(val for _, val in vals_list)}'
+
+    # colour of a square, and the colour of the odd steps if the prescribed values fix it
+    colour = (np.add.outer(np.arange(N), np.arange(N)) % 2)
+    odd_colours = {(colour[i, j] + val - 1) % 2 for (i, j), val in vals_list}
+    if len(odd_colours) > 1:
+        return 'the prescribed values do not alternate square colours'
+
+    nsquares = [int((colour == c).sum()) for c in (0, 1)]
+    nodd, neven = (K+1)//2, K//2
+    if not any(nodd <= nsquares[c] and neven <= nsquares[1-c] for c in (odd_colours or (0, 1))):
+        return f'{nodd} odd and {neven} even steps do not fit on the two square colours'
+
+    prescribed = {val for _, val in vals_list}
+    free_values = [[v for v in range(1, K+1) if v % 2 == p and v not in prescribed] for p in (0, 1)]
+
+    spare = stepsToSpare(grid, vals_list, target)
+    if spare < 0:
+        return f'the regions need {K - len(prescribed) - spare} free steps, the path has {K - len(prescribed)}'
+
+    for g in range(1, ngrids+1):
+        region = grid == g
+        vals_g = [val for (i, j), val in vals_list if region[i, j]]
+        deficit = target - sum(vals_g)
+        if deficit < 0:
+            return f'the prescribed values of region {g} exceed {target}'
+        if deficit == 0:
+            continue
+
+        free = region.copy()
+        for (i, j), _ in vals_list:
+            free[i, j] = False
+        # largest sum of the free values: with a known colour of the odd steps, odd values
+        # only go on the free squares of that colour
+        best = 0
+        for c in (odd_colours or (0, 1)):
+            nodd_g = int((free & (colour == c)).sum())
+            neven_g = int((free & (colour != c)).sum())
+            best = max(best, topSum(free_values[1], nodd_g) + topSum(free_values[0], neven_g))
+        if deficit > best:
+            return f'region {g} reaches at most {sum(vals_g) + best} < {target}'
+        if deficit < min(free_values[0] + free_values[1], default=deficit+1):
+            return f'region {g} needs {deficit} more, less than any free value'
+        # exact: some free odd and even values fitting on the free squares sum to the deficit
+        reachable = False
+        for c in (odd_colours or (0, 1)):
+            odd_sums = subsetSums(free_values[1], int((free & (colour == c)).sum()))
+            even_sums = subsetSums(free_values[0], int((free & (colour != c)).sum()))
+            even_any = set().union(*even_sums)
+            if any(deficit - t in even_any for sums in odd_sums for t in sums):
+                reachable = True
+                break
+        if not reachable:
+            return f'no free values on the squares of region {g} add up to the {deficit} missing'
+    return None
+
+def stepsToSpare(grid, vals_list, gridsum_target):
+    '''
+    Free steps of the path left once every region has the fewest squares that can make up 
+    its missing sum (each filled with the largest free values), ignoring colours
+    '''
+    ngrids = grid.max()
+    K = pathLength(gridsum_target, ngrids)
+    prescribed = {val for _, val in vals_list}
+    free_values = sorted((v for v in range(1, K+1) if v not in prescribed), reverse=True)
+    cumsum = np.cumsum([0] + free_values)
+    needed = 0
+    for g in range(1, ngrids+1):
+        region = grid == g
+        deficit = gridsum_target - sum(val for (i, j), val in vals_list if region[i, j])
+        if deficit > 0:
+            needed += int(np.searchsorted(cumsum, deficit)) # fewest values reaching the deficit
+    return K - len(prescribed) - needed
+
+def rankGridSums(grid, vals_list, gridsum_targets):
+    '''
+    Split candidate gridsum targets into the ones the bounds cannot rule out, ranked with the
+    most steps to spare first (stepsToSpare), and the rejected ones with their reason
+    '''
+    candidates = []
+    rejected = {}
+    for gridsum_target in gridsum_targets:
+        reason = rejectGridSum(grid, vals_list, gridsum_target)
+        if reason is None:
+            candidates.append(gridsum_target)
+        else:
+            rejected[gridsum_target] = reason
+    candidates.sort(key=lambda target: -stepsToSpare(grid, vals_list, target))
+    return candidates, rejected
@@ -0,0 +1,193 @@
+from ortools.sat.python import cp_model
+
+import numpy as np
+from GridSumBounds import pathLength
+
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SearchTimeout import SearchTimeout
+
+class KnightsBacktracker:
+    '''
+    Depth-first search for the knight's path of a given grid sum, without CP-SAT.
+    Same interface as KnightsMoveSolver (solutions, status, timings).
+
+    The path is extended one step at a time from the current cell:
+    * occupancy is a bitmask over the cells
+    * moves are tried in Warnsdorff order (fewest free onward moves first)
+    * prescribed values are waypoints: the next one must stay reachable in the steps
+        left (knight's move distance and colour parity)
+    * every region keeps its running sum, which must stay reachable: at most the
+        target, and the deficit covered by the largest values still to be placed
+        on its free cells
+    '''
+    def __init__(self,
+                vals_list: tuple[tuple[int, int], int],
+                grid: np.ndarray,
+                gridsum_target: int,
+                find_all_solutions: bool,
+                keep_onehot: bool = True,
+                time_limit: float = None):
+        self.find_all_solutions = find_all_solutions
+        self.keep_onehot = keep_onehot
+        self.time_limit = time_limit # seconds, None for no limit
+        self.solutions = []
+        self.timings = {}
+        self.nnodes = 0
+
+        tstart = time.time()
+        self.setup(vals_list, grid, gridsum_target)
+        self.timings['build'] = time.time() - tstart
+
+        tstart = time.time()
+        self.status = self.solve()
+        self.timings['solve'] = time.time() - tstart
+
+        if self.status == cp_model.FEASIBLE or self.status == cp_model.OPTIMAL:
+            logging.info(f'{len(self.solutions)} potential configurations found ({self.nnodes} nodes)')
+
+    @staticmethod
+    def knightsDistances(N):
+        '''
+        Knight's move distance between all pairs of cells (BFS), and the neighbours of each cell
+        '''
+        ij = np.array([(i, j) for i in range(N) for j in range(N)])
+        d = np.abs(ij[:, None, :] - ij[None, :, :])
+        adjacent = ((d[..., 0] == 1) & (d[..., 1] == 2)) | ((d[..., 0] == 2) & (d[..., 1] == 1))
+
+        dist = np.full((N**2, N**2), N**2, dtype=int)
+        np.fill_diagonal(dist, 0)
+        reached = np.eye(N**2, dtype=bool)
+        frontier = reached.copy()
+        for k in range(1, N**2):
+            frontier = (frontier.astype(np.int8) @ adjacent.astype(np.int8) > 0) & ~reached
+            if not frontier.any():
+                break
+            dist[frontier] = k
+            reached |= frontier
+        nbrs = [np.flatnonzero(row).tolist() for row in adjacent]
+        return dist, nbrs
+
+    def setup(self, vals_list, grid, gridsum_target):
+        N, _ = grid.shape
+        self.N = N
+        ngrids = grid.max()
+        self.gridsum_target = int(gridsum_target)
+
+        # the regions sum to 1+2+...+K for a path of K steps
+        self.K = pathLength(self.gridsum_target, ngrids, N**2)
+
+        dist, self.nbrs = self.knightsDistances(N)
+        self.dist = dist.tolist()
+        self.region = (grid.flatten() - 1).tolist()
+        self.ngrids = ngrids
+
+        # prescribed values: step -> cell, sorted waypoints. A value prescribed on two cells
+        # or a cell given two values leaves no path, as in the CP-SAT models (see solve)
+        clues = sorted({(i*N + j, val) for (i, j), val in vals_list})
+        self.nclues = len(clues)
+        self.anchor = {val: n for n, val in clues}
+        self.anchor_cells = {n for n, _ in clues}
+        self.waypoints = sorted(self.anchor.items())
+
+    def solve(self):
+        N, K = self.N, self.K
+        if K is None or any(val > K for val in self.anchor) or min(len(self.anchor), len(self.anchor_cells)) < self.nclues:
+            return cp_model.INFEASIBLE
+
+        # running state, updated in place along the search
+        self.steps = [0]*N**2
+        self.sums = [0]*self.ngrids
+        self.free = [0]*self.ngrids # cells of each region not visited yet
+        for n in range(N**2):
+            self.free[self.region[n]] += 1
+        self.occupied = 0
+        self.deadline = None if self.time_limit is None else time.time() + self.time_limit
+
+        if 1 in self.anchor:
+            starts = [self.anchor[1]]
+        else:
+            starts = [n for n in range(N**2) if n not in self.anchor_cells]
+        try:
+            for n in starts:
+                if self.place(n, 1) and self.extend(n, 1):
+                    return cp_model.FEASIBLE
+                self.unplace(n, 1)
+        except SearchTimeout:
+            return cp_model.FEASIBLE if self.solutions else cp_model.UNKNOWN
+        return cp_model.OPTIMAL if self.solutions else cp_model.INFEASIBLE
+
+    def place(self, n, v):
+        '''
+        Put step v on cell n, returning False if the state can no longer lead to a solution
+        (the state is updated regardless, undo with unplace)
+        '''
+        self.occupied |= 1 << n
+        self.steps[n] = v
+        g = self.region[n]
+        self.sums[g] += v
+        self.free[g] -= 1
+        return self.feasible(n, v)
+
+    def unplace(self, n, v):
+        self.occupied &= ~(1 << n)
+        self.steps[n] = 0
+        g = self.region[n]
+        self.sums[g] -= v
+        self.free[g] += 1
+
+    def feasible(self, n, v):
+        K = self.K
+        left = K - v
+        # next waypoint reachable in time, with the right colour
+        for val, cell in self.waypoints:
+            if val > v:
+                d = self.dist[n][cell]
+                if d > val - v or (val - v - d) % 2:
+                    return False
+                break
+        # region sums still reachable with the values left
+        target = self.gridsum_target
+        for g in range(self.ngrids):
+            deficit = target - self.sums[g]
+            if deficit < 0:
+                return False
+            if deficit == 0:
+                continue
+            m = min(self.free[g], left)
+            if deficit < v+1 or deficit > m*K - m*(m-1)//2:
+                return False
+        return True
+
+    def extend(self, n, v):
+        '''
+        Search all paths continuing from step v on cell n, True when the search can stop
+        '''
+        self.nnodes += 1
+        if self.deadline is not None and self.nnodes % 1024 == 0 and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        if v == self.K:
+            V = np.array(self.steps, dtype=int).reshape(self.N, self.N)
+            X = (V.reshape(-1, 1) == np.arange(self.N**2+1)).astype(np.int8) if self.keep_onehot else None
+            self.solutions.append((V, X))
+            return not self.find_all_solutions
+
+        if v+1 in self.anchor:
+            moves = [self.anchor[v+1]] if self.anchor[v+1] in self.nbrs[n] else []
+        else:
+            moves = [m for m in self.nbrs[n] if not (self.occupied >> m) & 1 and m not in self.anchor_cells]
+            # Warnsdorff: fewest onward moves first
+            moves.sort(key=lambda m: sum(1 for k in self.nbrs[m] if not (self.occupied >> k) & 1))
+
+        for m in moves:
+            if (self.occupied >> m) & 1:
+                continue
+            if self.place(m, v+1) and self.extend(m, v+1):
+                return True
+            self.unplace(m, v+1)
+        return False
@@ -2,19 +2,37 @@ from ortools.sat.python import cp_model
 
 import numpy as np
 from itertools import product
+from GridSumBounds import pathLength
 
 import logging
+import os
+import sys
+import time
 
-class KnightsMoveSolver(cp_model.CpSolverSolutionCallback):
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionCallback import ArraySolutionCallback
+
+class KnightsMoveSolver(ArraySolutionCallback):
     def __init__(self, 
                 vals_list: tuple[tuple[int, int], int], 
                 grid: np.ndarray,
-                gridsum_target: int,
-                find_all_solutions: bool):
-        cp_model.CpSolverSolutionCallback.__init__(self)
+                gridsum_target, # int, or list of candidate targets to solve in a single model
+                find_all_solutions: bool,
+                keep_onehot: bool = True,
+                num_search_workers: int = 0,
+                time_limit: float = None,
+                formulation: str = 'sparse',
+                hint: np.ndarray = None):
+        ArraySolutionCallback.__init__(self, keep_onehot)
         self.find_all_solutions = find_all_solutions
+        self.num_search_workers = num_search_workers # 0 lets CP-SAT use all cores
+        self.time_limit = time_limit # seconds, None for no limit
+        self.formulation = formulation # 'sparse' or 'dense' one-hot steps, or 'circuit' successor arcs
+        self.hint = hint # (N, N) steps to try first (0 where unknown), e.g. from a previous solve
+        self.timings = {}
         self.solutions = []
         status = self.solveKnightsMove(vals_list, grid, gridsum_target)
+        self.status = status
 
         if status == cp_model.INFEASIBLE:
             # print('No solution found')
@@ -28,17 +46,14 @@ class KnightsMoveSolver(cp_model.CpSolverSolutionCallback):
 
     def assignSol(self):
         N = self.N
-        x = self.x
-        X = np.zeros((N**2, N**2+1), dtype=int)
-        V = np.zeros((N, N), dtype=int)
-        nrange = [i for i in range(N**2)] # (0 to N^2)
-        vrange = [i for i in range(N**2+1)] # (0 to N^2)
-        for n in nrange:
-            for v in vrange:
-                if self.Value(x[n,v]):
-                    X[n,v] = 1
-                    V[self.n2ij(n)] += v
-        return V, X
+        values = self.solutionValues()
+        if self.formulation == 'circuit':
+            V = self.arrayValue('s', values, dtype=int)
+            X = self.encodeOneHot(V.flatten(), N**2+1) if self.keep_onehot else None
+        else:
+            X = self.arrayValue('x', values)
+            V = self.decodeOneHot(X).reshape(N, N)
+        return V, X if self.keep_onehot else None
 
     def n2ij(self, n):
         i = n // self.N
@@ -60,26 +75,33 @@ class KnightsMoveSolver(cp_model.CpSolverSolutionCallback):
         else:
             return 0
 
-    def solveKnightsMove(self, vals_list, grid, gridsum_target):
-        model = cp_model.CpModel()
-
-        N, _ = grid.shape
-        self.N = N
+    def knightsNeighbours(self, n):
+        '''
+        Cells a knight's move away from n (at most 8)
+        '''
+        i, j = self.n2ij(n)
+        N = self.N
+        moves = ((-2,-1), (-2,1), (-1,-2), (-1,2), (1,-2), (1,2), (2,-1), (2,1))
+        return [self.ij2n(i+di, j+dj) for di, dj in moves if 0 <= i+di < N and 0 <= j+dj < N]
 
+    def addOneHotModel(self, model, vals_list, grid, gridsum_target):
+        '''
+        x[n,v]: cell n holds step v (0 if unused)
+        '''
+        N = self.N
         ngrids = grid.max()
 
         nrange = [n for n in range(N**2)] # (0 to N^2-1)
         vrange = [v for v in range(N**2+1)] # (0 to N^2)
         Grange = [g+1 for g in range(ngrids)] # grid index
 
-        e = [[self.isKnightsMove(n1,n2) if n1 != n2 else 0 for n1 in nrange] for n2 in nrange]
-
         ## Define and save variables
         x = {}
         for n in nrange:
             for v in vrange:
                 x[n,v] = model.NewBoolVar(f'x[{n},{v}]')
         self.x = x
+        self.addArray('x', x.values(), (N**2, N**2+1))
 
 
         ## UNIQUENESS constraints
@@ -92,13 +114,24 @@ class KnightsMoveSolver(cp_model.CpSolverSolutionCallback):
                 model.AddAtMostOne(x[n,v] for n in nrange)
 
         ## Knight's move constraint
-        for n in nrange:
-            for v in vrange:
-                if v >= 1 and v <= N**2-1:
-                    nn = [i for i in nrange if i != n and not e[i][n]]
-                    model.Add(sum(x[i,v+1] for i in nn) <= 1 - x[n,v])
-                if v >= 2 and v <= N**2:
-                    model.Add(sum(x[i, v-1] for i in nrange) >= x[n,v])
+        if self.formulation == 'dense':
+            e = [[self.isKnightsMove(n1,n2) if n1 != n2 else 0 for n1 in nrange] for n2 in nrange]
+            for n in nrange:
+                for v in vrange:
+                    if v >= 1 and v <= N**2-1:
+                        nn = [i for i in nrange if i != n and not e[i][n]]
+                        model.Add(sum(x[i,v+1] for i in nn) <= 1 - x[n,v])
+                    if v >= 2 and v <= N**2:
+                        model.Add(sum(x[i, v-1] for i in nrange) >= x[n,v])
+        elif self.formulation == 'sparse':
+            # v-1 sits a knight's move away from v (v-1 is placed once, so v+1 is too)
+            nbrs = [self.knightsNeighbours(n) for n in nrange]
+            for n in nrange:
+                for v in vrange:
+                    if v >= 2:
+                        model.Add(sum(x[i, v-1] for i in nbrs[n]) >= x[n,v])
+        else:
+            raise ValueError(f'Unknown formulation {self.formulation}')
 
         # prescribed values
         for (i,j), val in vals_list:
@@ -108,9 +141,135 @@ class KnightsMoveSolver(cp_model.CpSolverSolutionCallback):
             subgrid_sum = sum(v*x[n,v] for n in nrange for v in vrange if grid[self.n2ij(n)] == g)
             model.Add(subgrid_sum == gridsum_target)
 
+        # steps 1..K are placed, nothing beyond (redundant with the grid sums, but lets the
+        # single model over all targets reason on the path length)
+        K, Kmax = self.addPathLength(model, gridsum_target, ngrids)
+        if K is not None:
+            placed = [sum(x[n,v] for n in nrange) for v in vrange if v > 0]
+            model.Add(sum(placed) == K)
+            for v in vrange:
+                if v > Kmax:
+                    for n in nrange:
+                        model.Add(x[n,v] == 0)
+
+    def addCircuitModel(self, model, vals_list, grid, gridsum_target):
+        '''
+        The knight's path as a circuit through a depot node (N^2) on the knight's move arcs,
+        with unused cells skipped by self-loops. s[n]: step of cell n (0 if unused).
+        '''
+        N = self.N
+        ngrids = grid.max()
+
+        nrange = [n for n in range(N**2)] # (0 to N^2-1)
+        Grange = [g+1 for g in range(ngrids)] # grid index
+        depot = N**2
+
+        K, Kmax = self.addPathLength(model, gridsum_target, ngrids)
+
+        ## Define and save variables
+        s = {n: model.NewIntVar(0, Kmax, f's[{n}]') for n in nrange}
+        self.s = s
+        self.addArray('s', s.values(), (N, N))
+
+        arcs = []
+        skips = []
+        for n in nrange:
+            skip = model.NewBoolVar(f'skip[{n}]')
+            skips.append(skip)
+            arcs.append((n, n, skip))
+            model.Add(s[n] == 0).OnlyEnforceIf(skip)
+            model.Add(s[n] >= 1).OnlyEnforceIf(skip.Not())
+            if isinstance(K, cp_model.IntVar):
+                model.Add(s[n] <= K)
+
+            first = model.NewBoolVar(f'first[{n}]')
+            arcs.append((depot, n, first))
+            model.Add(s[n] == 1).OnlyEnforceIf(first)
+            arcs.append((n, depot, model.NewBoolVar(f'last[{n}]')))
+
+            ## Knight's move constraint: arcs only between knight's move neighbours
+            for n2 in self.knightsNeighbours(n):
+                arc = model.NewBoolVar(f'arc[{n},{n2}]')
+                arcs.append((n, n2, arc))
+                model.Add(s[n2] == s[n] + 1).OnlyEnforceIf(arc)
+        model.AddCircuit(arcs)
+
+        # path of exactly K steps
+        if K is not None:
+            model.Add(sum(skips) == N**2 - K)
+        # each step is taken once (unused cells get distinct negative labels)
+        labels = []
+        for n in nrange:
+            label = model.NewIntVar(-N**2, N**2, f'label[{n}]')
+            model.Add(label == s[n]).OnlyEnforceIf(skips[n].Not())
+            model.Add(label == -n-1).OnlyEnforceIf(skips[n])
+            labels.append(label)
+        model.AddAllDifferent(labels)
+
+        # prescribed values
+        for (i,j), val in vals_list:
+            model.Add(s[self.ij2n(i,j)] == val)
+        # correct grid sum
+        for g in Grange:
+            model.Add(sum(s[n] for n in nrange if grid[self.n2ij(n)] == g) == gridsum_target)
+
+    def addPathLength(self, model, gridsum_target, ngrids):
+        '''
+        Path length K for the gridsum target (otherwise the region sums are infeasible) and its
+        upper bound. When the target is a variable, K is a variable tied to it by a table.
+        '''
+        N = self.N
+        if not isinstance(gridsum_target, cp_model.IntVar):
+            K = pathLength(gridsum_target, ngrids, N**2)
+            return K, N**2 if K is None else K
+
+        pairs = [(target, pathLength(target, ngrids, N**2)) for target in self.gridsum_targets]
+        pairs = [(target, K) for target, K in pairs if K is not None]
+        K = model.NewIntVarFromDomain(cp_model.Domain.FromValues(sorted({K for _, K in pairs})), 'K')
+        model.AddAllowedAssignments([gridsum_target, K], pairs)
+        return K, max((K for _, K in pairs), default=N**2)
+
+    def solveKnightsMove(self, vals_list, grid, gridsum_target):
+        tstart = time.time()
+        model = cp_model.CpModel()
+
+        N, _ = grid.shape
+        self.N = N
+
+        if not np.isscalar(gridsum_target):
+            # single model over all the candidate targets: the common region sum is a variable
+            self.gridsum_targets = [int(target) for target in gridsum_target]
+            gridsum_target = model.NewIntVarFromDomain(cp_model.Domain.FromValues(self.gridsum_targets), 'gridsum')
+        self.gridsum = gridsum_target
+
+        if self.formulation == 'circuit':
+            self.addCircuitModel(model, vals_list, grid, gridsum_target)
+        else:
+            self.addOneHotModel(model, vals_list, grid, gridsum_target)
+
+        self.nhints = 0
+        if self.hint is not None:
+            hint = np.asarray(self.hint)
+            if self.formulation == 'circuit':
+                self.nhints = self.addHints(model, 's', hint, mask=hint > 0)
+            else:
+                self.nhints = self.addHints(model, 'x', hint.flatten(), mask=hint.flatten() > 0)
+
+        self.model = model
+        self.timings['build'] = time.time() - tstart
+
         # SOLVE
+        tstart = time.time()
         solver = cp_model.CpSolver()
         solver.parameters.enumerate_all_solutions = self.find_all_solutions
+        solver.parameters.num_search_workers = self.num_search_workers
+        if self.time_limit is not None:
+            solver.parameters.max_time_in_seconds = self.time_limit
+        if self.formulation == 'circuit':
+            # the LP relaxation of the circuit slows the search down more than it prunes
+            solver.parameters.linearization_level = 0
         status = solver.Solve(model, self)
+        self.timings['solve'] = time.time() - tstart
+        self.search_stats = {'conflicts': solver.NumConflicts(), 'branches': solver.NumBranches()}
         return status
 
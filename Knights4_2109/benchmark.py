@@ -0,0 +1,60 @@
+import numpy as np
+import time
+import sys
+
+import main
+from KnightsMoveSolver import KnightsMoveSolver
+from tests import ex_grid, ex_vals_list
+
+def benchmark(name, grid, vals_list, gridsum_target, formulations, find_all_solutions=False, time_limit=None):
+    '''
+    Model size, build and solve time of each formulation for one gridsum target
+    '''
+    print(f'====={name}, gridsum {gridsum_target}=====')
+    for formulation in formulations:
+        solver = KnightsMoveSolver(vals_list, grid, gridsum_target, find_all_solutions, keep_onehot=False,
+                                   time_limit=time_limit, formulation=formulation)
+        proto = solver.model.Proto()
+        nterms = sum(len(ct.linear.vars) for ct in proto.constraints)
+        print(f'{formulation:>8}: {len(proto.variables):6d} variables, {len(proto.constraints):6d} constraints, '
+              f'{nterms:8d} linear terms, '
+              f'build {solver.timings["build"]*1000:10.2f}ms, solve {solver.timings["solve"]*1000:10.2f}ms, '
+              f'{len(solver.solutions)} solutions')
+
+# findSolution options compared over the whole sweep
+SWEEPS = {
+    'cpsat': {},
+    'single': {'single_model': True},
+    'backtrack': {'backend': 'backtrack'},
+}
+
+# warm starts compared over every target the bounds would have skipped too
+HINTS = {
+    'cold': {'hints': False, 'bounds': False},
+    'hinted': {'hints': True, 'bounds': False},
+}
+
+def benchmarkSweeps(name, grid, vals_list, sweeps, find_all_solutions=False):
+    '''
+    Time the whole findSolution sweep over the gridsum targets for each set of options
+    '''
+    print(f'====={name}, all gridsums, find_all_solutions={find_all_solutions}=====')
+    for sweep in sweeps:
+        tstart = time.time()
+        solutions = main.findSolution(grid, vals_list, find_all_solutions, **sweeps[sweep])
+        elapsed = time.time() - tstart
+        score = main.computeSol(solutions[0])[0] if solutions else None
+        print(f'{sweep:>9}: {elapsed*1000:10.2f}ms, {len(solutions)} solutions, sum {score}')
+
+if __name__ == '__main__':
+    # the 10x10 dense model alone takes seconds to build, pass "quick" to skip it
+    formulations = ['dense', 'sparse', 'circuit']
+    benchmark('example 5x5', ex_grid, ex_vals_list, 15, formulations, find_all_solutions=True)
+    benchmark('empty 4x4', np.ones((4, 4), dtype=int), [], 21, formulations, find_all_solutions=True)
+    benchmarkSweeps('example 5x5', ex_grid, ex_vals_list, SWEEPS, find_all_solutions=True)
+    benchmarkSweeps('example 5x5', ex_grid, ex_vals_list, HINTS)
+    if 'quick' not in sys.argv:
+        benchmark('puzzle 10x10', main.grid, main.vals_list, 75, formulations, time_limit=60)
+        for find_all_solutions in (False, True):
+            benchmarkSweeps('puzzle 10x10', main.grid, main.vals_list, SWEEPS, find_all_solutions)
+        benchmarkSweeps('puzzle 10x10', main.grid, main.vals_list, HINTS)
@@ -1,13 +1,19 @@
 import numpy as np
 import time
 import logging
+import multiprocessing
+import os
+import queue
+import sys
 
 from collections import Counter
+from ortools.sat.python import cp_model
 from KnightsMoveSolver import KnightsMoveSolver
+from KnightsBacktracker import KnightsBacktracker
+from GridSumBounds import rankGridSums
 
-logging.basicConfig(filename='knights4.log', filemode='w',
-    level=logging.INFO,
-    format='[%(levelname)s] %(message)s')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SweepCheckpoint import SweepCheckpoint
 
 grid = np.array([
     [ 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
@@ -62,20 +68,206 @@ def computeSol(vals):
     max_squares = [row.max()**2 for row in vals]
     return sum(max_squares), max_squares
 
-def findSolution(grid, vals_list, find_all_solutions = False):
+def anchorHint(grid, vals_list):
+    '''
+    Partial path from the prescribed values, to hint the solver with: consecutive prescribed 
+    values whose gap equals their knight's move distance are joined by a shortest path
+    '''
     N, _ = grid.shape
+    dist, nbrs = KnightsBacktracker.knightsDistances(N)
+    hint = np.zeros(N**2, dtype=int)
+    anchors = sorted((val, i*N + j) for (i, j), val in vals_list)
+    for val, n in anchors:
+        hint[n] = val
+    for (v1, n1), (v2, n2) in zip(anchors, anchors[1:]):
+        if dist[n1, n2] != v2 - v1:
+            continue
+        n = n1
+        for v in range(v1+1, v2):
+            n = min(m for m in nbrs[n] if dist[m, n2] == v2 - v)
+            hint[n] = v
+    return hint.reshape(N, N)
+
+def solveGridSum(vals_list, grid, gridsum_target, find_all_solutions, num_search_workers=0, time_limit=None,
+                 formulation='sparse', backend='cpsat', hint=None, attempt=None):
+    '''
+    Solutions for one gridsum target, and whether the search for them completed
+    (False if the time limit cut it short)
+    hint: optional (N, N) partial path to try first (0 where unknown)
+    attempt: optional dict, filled with stats about the solve
+    '''
+    if backend == 'backtrack':
+        solver = KnightsBacktracker(vals_list, grid, gridsum_target, find_all_solutions, keep_onehot=False,
+                                    time_limit=time_limit)
+    elif backend == 'cpsat':
+        solver = KnightsMoveSolver(vals_list, grid, gridsum_target, find_all_solutions, keep_onehot=False,
+                                   num_search_workers=num_search_workers, time_limit=time_limit,
+                                   formulation=formulation, hint=hint)
+    else:
+        raise ValueError(f'Unknown backend {backend}')
+    solutions = [vals for vals, _ in solver.solutions]
+    if attempt is not None:
+        attempt.update({'gridsum': int(gridsum_target) if np.isscalar(gridsum_target) else None,
+                        'status': solver.status.name, 'solutions': len(solutions),
+                        'solve_ms': round(solver.timings['solve']*1000, 2)})
+        if backend == 'cpsat':
+            attempt.update(solver.search_stats)
+            attempt['hints'] = solver.nhints
+            if solver.nhints and solutions:
+                # share of the hinted cells the solution agrees with
+                hinted = hint > 0
+                attempt['hints_kept'] = round(float((solutions[0][hinted] == hint[hinted]).mean()), 2)
+    complete = (solver.status == cp_model.INFEASIBLE or solver.status == cp_model.OPTIMAL or
+                (solver.status == cp_model.FEASIBLE and not find_all_solutions))
+    if not complete:
+        logging.warning(f'Gridsum {gridsum_target}: time limit reached, {len(solutions)} solutions found so far')
+    return solutions, complete
+
+def raceWorker(results, gridsum_target, *args):
+    results.put((gridsum_target, *solveGridSum(*args)))
+
+def raceGridSums(grid, vals_list, gridsum_targets, find_all_solutions, time_limit, formulation, backend,
+                 hint=None):
+    '''
+    Solve every gridsum target in its own process, yielding (target, solutions, complete) 
+    as they finish. Processes still running when the caller stops iterating are killed.
+    hint: optional (N, N) partial path every target starts from
+    '''
+    results = multiprocessing.Queue()
+    # share the cores between the targets rather than oversubscribing them
+    num_search_workers = max(1, (os.cpu_count() or 1) // max(1, len(gridsum_targets)))
+    procs = {}
+    for gridsum_target in gridsum_targets:
+        args = (vals_list, grid, gridsum_target, find_all_solutions, num_search_workers, time_limit, formulation, backend,
+                hint)
+        procs[gridsum_target] = multiprocessing.Process(target=raceWorker, args=(results, gridsum_target, *args), daemon=True)
+        procs[gridsum_target].start()
+
+    try:
+        pending = set(gridsum_targets)
+        while pending:
+            try:
+                gridsum_target, solutions, complete = results.get(timeout=1)
+            except queue.Empty:
+                failed = [target for target in pending if procs[target].exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f'Solver process for gridsum {failed[0]} failed')
+                continue
+            pending.discard(gridsum_target)
+            yield gridsum_target, solutions, complete
+    finally:
+        for proc in procs.values():
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+
+def sweepGridSums(grid, vals_list, gridsum_targets, find_all_solutions, time_limit, formulation, backend,
+                  stats, hint=None):
+    '''
+    Solve the gridsum targets one after another, yielding (target, solutions, complete).
+    hint: optional (N, N) partial path the first solve starts from, each later solve starts
+        from the path of the latest solution found (or the same hint before any solution)
+    '''
+    for gridsum_target in gridsum_targets:
+        attempt = {}
+        solutions, complete = solveGridSum(vals_list, grid, gridsum_target, find_all_solutions,
+                                           time_limit=time_limit, formulation=formulation, backend=backend,
+                                           hint=hint, attempt=attempt)
+        stats['attempts'].append(attempt)
+        logging.info(f'Gridsum {gridsum_target}: {attempt}')
+        if hint is not None and solutions:
+            hint = solutions[0]
+        yield gridsum_target, solutions, complete
+
+def singleModelGridSums(grid, vals_list, gridsum_targets, find_all_solutions, time_limit, formulation, hint=None):
+    '''
+    Solve all gridsum targets in one model with the gridsum as a variable, yielding
+    (target, solutions, complete) per target like the other sweeps
+    '''
+    if not gridsum_targets:
+        return
+    solutions, complete = solveGridSum(vals_list, grid, gridsum_targets, find_all_solutions,
+                                       time_limit=time_limit, formulation=formulation, hint=hint)
+    found = {vals[grid == 1].sum() for vals in solutions}
+    for gridsum_target in gridsum_targets:
+        # a first solution says nothing about the other targets
+        if find_all_solutions or not solutions or gridsum_target in found:
+            yield gridsum_target, [vals for vals in solutions if vals[grid == 1].sum() == gridsum_target], complete
+
+def findSolution(grid, vals_list, find_all_solutions = False, checkpoint = None, race = False, time_limit = None,
+                 formulation = 'sparse', backend = 'cpsat', single_model = False, hints = True, stats = None,
+                 bounds = True):
+    '''
+    checkpoint: optional path of an append-only file recording the finished gridsum targets,
+        an interrupted sweep resumes from it
+    race: solve all gridsum targets concurrently in separate processes and return the first 
+        solution found (or merge all of them as they arrive), instead of one target after another
+    time_limit: optional limit in seconds on the search for each gridsum target
+    formulation: 'sparse' (knight's move constraints over the <= 8 neighbours of each cell),
+        'dense' (over all the other cells, the original model) or 'circuit' (the path as
+        successor arcs between knight's move neighbours, see KnightsMoveSolver.addCircuitModel)
+    backend: 'cpsat' (KnightsMoveSolver with the given formulation) or 'backtrack' 
+        (KnightsBacktracker, a depth-first search over knight's paths)
+    single_model: solve all gridsum targets in one CP-SAT model where the common region sum 
+        is a variable, instead of one model per target (time_limit then applies to the whole solve)
+    hints: warm-start every CP-SAT solve from the best path known so far: the latest solution
+        (from the checkpoint, then from the sequential sweep, see sweepGridSums), or else the
+        prescribed values joined by shortest paths (anchorHint)
+    stats: optional dict, 'attempts' lists the stats of each solve of the sequential sweep,
+        'rejected' the gridsum targets ruled out by the bounds and why
+    bounds: drop the gridsum targets ruled out by the bounds of GridSumBounds before solving,
+        and try the others in the order of rankGridSums
+    '''
+    N, _ = grid.shape
+    stats = {} if stats is None else stats
+    stats.setdefault('attempts', [])
     solutions = []
+    if checkpoint is not None:
+        checkpoint = SweepCheckpoint(checkpoint, (grid, vals_list, find_all_solutions))
+        logging.info(f'Resuming from {checkpoint.path}: {len(checkpoint)} gridsum targets already swept')
+
+    candidates = allValidGridSums(grid, vals_list, N)
+    if bounds:
+        candidates, stats['rejected'] = rankGridSums(grid, vals_list, candidates)
+        for gridsum_target, reason in stats['rejected'].items():
+            logging.info(f'Gridsum {gridsum_target} rejected: {reason}')
 
-    for i, gridsum_target in enumerate(allValidGridSums(grid, vals_list, N)):
-        tstart = time.time()
-        NPSolver = KnightsMoveSolver(vals_list, grid, gridsum_target, find_all_solutions)
+    gridsum_targets = []
+    for gridsum_target in candidates:
+        if checkpoint is not None and gridsum_target in checkpoint:
+            for vals in checkpoint.result(gridsum_target):
+                solutions.append(np.array(vals, dtype=int))
+                if not find_all_solutions:
+                    return solutions
+        else:
+            gridsum_targets.append(gridsum_target)
 
-        for vals, _ in NPSolver.solutions:
-            solutions.append(vals)
-            if not find_all_solutions:
-                return solutions
+    hint = None
+    if hints and backend == 'cpsat':
+        hint = solutions[-1] if solutions else anchorHint(grid, vals_list)
+
+    if single_model:
+        if race or backend != 'cpsat':
+            raise ValueError('single_model needs the cpsat backend and no race')
+        results = singleModelGridSums(grid, vals_list, gridsum_targets, find_all_solutions, time_limit, formulation,
+                                      hint)
+    elif race:
+        results = raceGridSums(grid, vals_list, gridsum_targets, find_all_solutions, time_limit, formulation, backend,
+                               hint)
+    else:
+        results = sweepGridSums(grid, vals_list, gridsum_targets, find_all_solutions, time_limit, formulation, backend,
+                                stats, hint)
+
+    tstart = time.time()
+    for gridsum_target, target_solutions, complete in results:
+        if checkpoint is not None and complete:
+            checkpoint.record(gridsum_target, target_solutions)
 
-        logging.debug(f'Testing gridsum {i}={gridsum_target}: {(time.time() - tstart)*1000:.2f}ms elapsed, found {len(solutions)} solutions')
+        solutions.extend(target_solutions)
+        logging.debug(f'Tested gridsum {gridsum_target}: {(time.time() - tstart)*1000:.2f}ms elapsed, found {len(solutions)} solutions')
+        if solutions and not find_all_solutions:
+            results.close()
+            return solutions[:1]
 
     return solutions
 
@@ -100,6 +292,10 @@ def main(grid, vals_list):
 
 
 if __name__ == '__main__':
+    # only the parent process writes the log: spawned workers re-import this module
+    logging.basicConfig(filename='knights4.log', filemode='w',
+        level=logging.INFO,
+        format='[%(levelname)s] %(message)s')
     main(np.array(grid, dtype=int), vals_list)
     # from tests import ex_grid, ex_vals_list
     # main(ex_grid, ex_vals_list)
\ No newline at end of file
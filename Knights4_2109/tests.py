@@ -1,10 +1,15 @@
 
 from zmq import MAX_SOCKETS
 import main
+from KnightsMoveSolver import KnightsMoveSolver
+from KnightsBacktracker import KnightsBacktracker
+from GridSumBounds import rankGridSums, rejectGridSum
 
 import numpy as np
 import matplotlib.pyplot as plt
 
+import os
+import tempfile
 import unittest
 
 ex_N = 5
@@ -46,6 +51,125 @@ class TestSetup(unittest.TestCase):
         max_squares_sum, _ = main.computeSol(vals)
         self.assertEqual(max_squares_sum, 219)
 
+    def testSolverOneHot(self):
+        gridsum_target = ex_vals[ex_grid == 1].sum()
+        for keep_onehot in (True, False):
+            solver = KnightsMoveSolver(ex_vals_list, ex_grid, gridsum_target, False, keep_onehot=keep_onehot)
+            vals, X = solver.solutions.pop()
+            self.assertTrue((vals == ex_vals).all())
+            if keep_onehot:
+                self.assertTrue((X.argmax(axis=1).reshape(ex_N, ex_N) == ex_vals).all())
+                self.assertEqual(X.sum(), ex_N**2)
+            else:
+                self.assertIsNone(X)
+
+    def testFormulations(self):
+        for formulation in ('dense', 'circuit'):
+            solutions = main.findSolution(ex_grid, ex_vals_list, True, formulation=formulation)
+            self.assertEqual(len(solutions), 1)
+            self.assertTrue((solutions.pop() == ex_vals).all())
+
+        # same placements with and without prescribed values
+        for vals_list, grid, gridsum_target in ((ex_vals_list, ex_grid, 15), ([], np.ones((4, 4), dtype=int), 10)):
+            placements = {}
+            for formulation in ('dense', 'sparse', 'circuit'):
+                solver = KnightsMoveSolver(vals_list, grid, gridsum_target, True, formulation=formulation)
+                placements[formulation] = sorted(vals.tobytes() for vals, _ in solver.solutions)
+            self.assertEqual(placements['dense'], placements['sparse'])
+            self.assertEqual(placements['dense'], placements['circuit'])
+
+    def testBacktracker(self):
+        for find_all_solutions in (False, True):
+            solutions = main.findSolution(ex_grid, ex_vals_list, find_all_solutions, backend='backtrack')
+            self.assertEqual(len(solutions), 1)
+            self.assertTrue((solutions.pop() == ex_vals).all())
+
+        for gridsum_target in (10, 15, 21):
+            grid = np.ones((4, 4), dtype=int)
+            backtracker = KnightsBacktracker([], grid, gridsum_target, True)
+            solver = KnightsMoveSolver([], grid, gridsum_target, True)
+            self.assertEqual(sorted(vals.tobytes() for vals, _ in backtracker.solutions),
+                             sorted(vals.tobytes() for vals, _ in solver.solutions))
+
+    def testBacktrackerDuplicateAnchors(self):
+        gridsum_target = ex_vals[ex_grid == 1].sum()
+        # the same value on two cells, or two values on one cell: no path for either backend
+        for vals_list in (ex_vals_list + [((4,4),1)], ex_vals_list + [((0,0),2)]):
+            backtracker = KnightsBacktracker(vals_list, ex_grid, gridsum_target, True)
+            solver = KnightsMoveSolver(vals_list, ex_grid, gridsum_target, True)
+            self.assertEqual(backtracker.solutions, [])
+            self.assertEqual(solver.solutions, [])
+        # a clue repeated as is changes nothing
+        backtracker = KnightsBacktracker(ex_vals_list + [ex_vals_list[0]], ex_grid, gridsum_target, False)
+        self.assertTrue((backtracker.solutions.pop()[0] == ex_vals).all())
+
+    def testSingleModel(self):
+        for formulation in ('sparse', 'circuit'):
+            for find_all_solutions in (False, True):
+                solutions = main.findSolution(ex_grid, ex_vals_list, find_all_solutions, formulation=formulation,
+                                              single_model=True)
+                self.assertEqual(len(solutions), 1)
+                self.assertTrue((solutions.pop() == ex_vals).all())
+
+        # every target of an empty board at once
+        grid = np.ones((4, 4), dtype=int)
+        solver = KnightsMoveSolver([], grid, [10, 15], True)
+        self.assertEqual(len(solver.solutions), 208 + 400)
+
+    def testHints(self):
+        hint = main.anchorHint(ex_grid, ex_vals_list)
+        for (i, j), val in ex_vals_list:
+            self.assertEqual(hint[i, j], val)
+
+        for formulation in ('sparse', 'circuit'):
+            stats = {}
+            solutions = main.findSolution(ex_grid, ex_vals_list, True, formulation=formulation, hints=True, stats=stats)
+            self.assertEqual(len(solutions), 1)
+            self.assertTrue((solutions.pop() == ex_vals).all())
+            self.assertEqual(len(stats['attempts']) + len(stats['rejected']),
+                             len(main.allValidGridSums(ex_grid, ex_vals_list, ex_N)))
+            self.assertTrue(all(attempt['hints'] > 0 for attempt in stats['attempts']))
+
+    def testGridSumBounds(self):
+        candidates, rejected = rankGridSums(ex_grid, ex_vals_list, main.allValidGridSums(ex_grid, ex_vals_list, ex_N))
+        self.assertEqual(candidates, [15])
+        self.assertEqual(len(rejected), 6)
+
+        # the bounds never reject a target that has a solution
+        grid = np.array([[1,1,2,2], [1,1,2,2], [3,3,2,2], [3,3,3,3]], dtype=int)
+        for gridsum_target in range(1, 40):
+            if rejectGridSum(grid, [], gridsum_target) is not None:
+                self.assertFalse(KnightsBacktracker([], grid, gridsum_target, False).solutions)
+
+        solutions = main.findSolution(ex_grid, ex_vals_list, True, bounds=False)
+        self.assertTrue((solutions.pop() == ex_vals).all())
+
+    def testFindSolutionCheckpoint(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'knights4.ckpt')
+            solutions = main.findSolution(ex_grid, ex_vals_list, checkpoint=path)
+            nlines = len(open(path).readlines())
+
+            # resuming answers from the checkpoint without new solves
+            resumed = main.findSolution(ex_grid, ex_vals_list, checkpoint=path)
+            self.assertEqual(len(open(path).readlines()), nlines)
+            self.assertTrue((resumed.pop() == solutions.pop()).all())
+            self.assertTrue((main.findSolution(ex_grid, ex_vals_list)[0] == ex_vals).all())
+
+            with self.assertRaises(ValueError):
+                main.findSolution(ex_grid, ex_vals_list[:2], checkpoint=path)
+
+    def testFindSolutionRace(self):
+        # without the bounds every gridsum target is raced, and the losers are cancelled
+        self.assertGreater(len(main.allValidGridSums(ex_grid, ex_vals_list, ex_N)), 1)
+        solutions = main.findSolution(ex_grid, ex_vals_list, race=True, time_limit=60, bounds=False)
+        self.assertEqual(len(solutions), 1)
+        self.assertTrue((solutions.pop() == ex_vals).all())
+
+        solutions = main.findSolution(ex_grid, ex_vals_list, True, race=True, bounds=False)
+        self.assertEqual(len(solutions), 1)
+        self.assertTrue((solutions.pop() == ex_vals).all())
+
 def checkGrid(grid=main.grid):
         fig, ax = plt.subplots()
         cmap = 'tab20'
@@ -0,0 +1,6 @@
+class SearchTimeout(Exception):
+    '''
+    Raised from deep inside a hand-written search (backtracking, branching) once its time
+    limit is up, and caught at the top of the search to report what was found so far.
+    '''
+    pass
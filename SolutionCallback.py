@@ -0,0 +1,73 @@
+from ortools.sat.python import cp_model
+
+import numpy as np
+
+class ArraySolutionCallback(cp_model.CpSolverSolutionCallback):
+    '''
+    Solution callback keeping the model variables in index-aligned numpy arrays, so a
+    solution is read with one bulk copy of the response instead of one Value() call per
+    variable, and decoded with array operations.
+
+    keep_onehot: also return the one-hot arrays (X) with each solution, not just the values
+    '''
+    def __init__(self, keep_onehot: bool = True):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.keep_onehot = keep_onehot
+        self.var_index = {}
+        self.var_arrays = {}
+
+    def addArray(self, name, variables, shape):
+        '''
+        Register variables (listed in C order of shape) under name
+        '''
+        variables = list(variables)
+        self.var_index[name] = np.array([var.Index() for var in variables], dtype=np.int64).reshape(shape)
+        self.var_arrays[name] = np.empty(len(variables), dtype=object)
+        self.var_arrays[name][:] = variables
+        self.var_arrays[name] = self.var_arrays[name].reshape(shape)
+
+    def addHints(self, model, name, values, mask=None):
+        '''
+        Hint the variables registered under name with values (e.g. from a previous solve).
+        For a one-hot array (one more axis than values), value v hints x[...,v] to 1 and the
+        others to 0. mask: optional boolean array of the entries to hint, e.g. a partial path.
+        Returns the number of hinted entries.
+        '''
+        variables = self.var_arrays[name]
+        values = np.asarray(values)
+        mask = np.ones(values.shape, dtype=bool) if mask is None else mask
+        onehot = variables.ndim == values.ndim + 1
+        if onehot:
+            variables = variables.reshape(*values.shape, -1)
+        for idx in zip(*np.nonzero(mask)):
+            if onehot:
+                for v, var in enumerate(variables[idx]):
+                    model.AddHint(var, int(values[idx] == v))
+            else:
+                model.AddHint(variables[idx], int(values[idx]))
+        return int(mask.sum())
+
+    def solutionValues(self, solver=None):
+        '''
+        Values of all the model variables, from the callback or from the solver after a search
+        '''
+        response = self.Response() if solver is None else solver.ResponseProto()
+        solution = response.solution
+        return np.fromiter(solution, dtype=np.int64, count=len(solution))
+
+    def arrayValue(self, name, values, dtype=np.int8):
+        return values[self.var_index[name]].astype(dtype)
+
+    @staticmethod
+    def decodeOneHot(X, offset=0):
+        '''
+        Values of a one-hot array along its last axis (index + offset)
+        '''
+        return X.argmax(axis=-1) + offset
+
+    @staticmethod
+    def encodeOneHot(V, nvals, offset=0):
+        '''
+        One-hot array of values V in offset..offset+nvals-1, along a new last axis
+        '''
+        return (V[..., None] == np.arange(offset, offset+nvals)).astype(np.int8)
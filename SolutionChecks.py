@@ -0,0 +1,75 @@
+'''
+Vectorized checks of candidate solutions. Every check takes a single solution or a batch
+stacked along the leading axes, and returns one result per solution.
+'''
+import numpy as np
+
+def taxicabErrors(V: np.ndarray):
+    '''
+    Block Party rule on (..., N, N) values: the nearest other cell with the same value v
+    is at taxicab distance exactly v. Returns two (..., N, N) masks of the cells breaking it:
+    closer (an equal value at distance < v) and missing (no equal value at distance v).
+    '''
+    V = np.asarray(V)
+    N = V.shape[-1]
+    flat = V.reshape(*V.shape[:-2], N**2)
+
+    i, j = np.divmod(np.arange(N**2), N)
+    dist = np.abs(i[:, None] - i[None, :]) + np.abs(j[:, None] - j[None, :])
+    # pairwise distances between equal values, N^2 (beyond any cell) elsewhere
+    equal = flat[..., :, None] == flat[..., None, :]
+    equal[..., np.arange(N**2), np.arange(N**2)] = False
+    dist_equal = np.where(equal, dist, N**2)
+
+    closer = dist_equal.min(axis=-1) < flat
+    missing = ~(dist_equal == flat[..., None]).any(axis=-1)
+    return closer.reshape(V.shape), missing.reshape(V.shape)
+
+def taxicabValid(V: np.ndarray):
+    closer, missing = taxicabErrors(V)
+    return ~(closer | missing).any(axis=(-2, -1))
+
+def firstSeen(V: np.ndarray, side: str):
+    '''
+    First nonzero value of each row/column of (..., N, N) values, seen from side
+    ('t'op, 'b'ottom, 'l'eft or 'r'ight), 0 for an empty row/column
+    '''
+    V = np.asarray(V)
+    # top and bottom look at columns, i.e. transposed rows
+    if side in ('t', 'b'):
+        V = np.swapaxes(V, -2, -1)
+    # right and bottom views see the tail of the row/col
+    if side in ('r', 'b'):
+        V = V[..., ::-1]
+    elif side not in ('l', 't'):
+        raise ValueError(f'Unknown side {side}')
+    head = (V != 0).argmax(axis=-1)
+    return np.take_along_axis(V, head[..., None], axis=-1)[..., 0]
+
+def viewsValid(V: np.ndarray, views: dict):
+    '''
+    Twenty Four Seven views on (..., N, N) values: views maps 'top_view', 'bot_view',
+    'lft_view' and 'rgt_view' (or just the side letter) to ((row/col index, first value seen), ...)
+    '''
+    valid = np.ones(np.shape(V)[:-2], dtype=bool)
+    for name, view in views.items():
+        if not view:
+            continue
+        seen = firstSeen(V, name[0])
+        idx, expected = np.array(view).T
+        valid &= (seen[..., idx] == expected).all(axis=-1)
+    return valid
+
+def magicSpread(squares: np.ndarray):
+    '''
+    Largest minus smallest of the 3 row, 3 column and 2 diagonal sums of (..., 9) squares
+    (row-major 3x3)
+    '''
+    S = np.asarray(squares).reshape(*np.shape(squares)[:-1], 3, 3)
+    sums = np.concatenate([S.sum(axis=-1), S.sum(axis=-2),
+                           np.trace(S, axis1=-2, axis2=-1)[..., None],
+                           np.trace(S[..., ::-1], axis1=-2, axis2=-1)[..., None]], axis=-1)
+    return sums.max(axis=-1) - sums.min(axis=-1)
+
+def magicValid(squares: np.ndarray, tolerance: int = 1):
+    return magicSpread(squares) <= tolerance
@@ -0,0 +1,82 @@
+import numpy as np
+
+import hashlib
+import json
+import os
+
+def toJSON(obj):
+    '''
+    Convert numpy arrays/scalars (and tuples) to plain lists/ints for json
+    '''
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (list, tuple)):
+        return [toJSON(o) for o in obj]
+    if isinstance(obj, dict):
+        return {k: toJSON(v) for k, v in obj.items()}
+    return obj
+
+class SweepCheckpoint:
+    '''
+    Append-only record of the finished items of a long sweep (e.g. hook index ranges
+    or gridsum targets) and what they produced, so an interrupted sweep can be resumed.
+
+    One json object per line; the first line identifies the instance being swept,
+    so a checkpoint is never resumed for a different puzzle.
+    '''
+    def __init__(self, path, instance):
+        self.path = path
+        self.instance = hashlib.sha1(repr(toJSON(instance)).encode()).hexdigest()
+        self.items = {}
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.load()
+        else:
+            self.write({'instance': self.instance})
+
+    def load(self):
+        with open(self.path) as f:
+            lines = f.readlines()
+        header = json.loads(lines[0])
+        if header['instance'] != self.instance:
+            raise ValueError(f'Checkpoint {self.path} was written for a different instance')
+
+        offset = len(lines[0])
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = None
+            if entry is None or not line.endswith('\n'):
+                # only the last line can be cut short by an interruption, drop it
+                with open(self.path, 'r+') as f:
+                    f.truncate(offset)
+                break
+            self.items[self.key(entry['item'])] = entry['result']
+            offset += len(line)
+
+    def write(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def key(item):
+        return tuple(item) if isinstance(item, list) else item
+
+    def __contains__(self, item):
+        return self.key(toJSON(item)) in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def record(self, item, result):
+        item, result = toJSON(item), toJSON(result)
+        self.write({'item': item, 'result': result})
+        self.items[self.key(item)] = result
+
+    def result(self, item):
+        return self.items[self.key(toJSON(item))]
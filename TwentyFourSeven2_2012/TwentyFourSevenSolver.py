@@ -2,19 +2,27 @@ from ortools.sat.python import cp_model
 from itertools import product
 import numpy as np
 import logging
+import os
+import sys
 
-class TwentyFourSevenSolver(cp_model.CpSolverSolutionCallback):
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionCallback import ArraySolutionCallback
+
+class TwentyFourSevenSolver(ArraySolutionCallback):
     def __init__(self, 
                 vals_list, 
                 top_view,
                 bot_view,
                 lft_view,
                 rgt_view,
-                find_all_solutions: bool):
+                find_all_solutions: bool,
+                keep_onehot: bool = True,
+                num_search_workers: int = 0):
 
         self.N = 7
-        cp_model.CpSolverSolutionCallback.__init__(self)
+        ArraySolutionCallback.__init__(self, keep_onehot)
         self.find_all_solutions = find_all_solutions
+        self.num_search_workers = num_search_workers # 0 lets CP-SAT use all cores
         self.solutions = []
         status = self.solveTwentyFourSeven(vals_list, top_view, bot_view, lft_view, rgt_view)
 
@@ -31,29 +39,14 @@ class TwentyFourSevenSolver(cp_model.CpSolverSolutionCallback):
 
     def assignSol(self):
         N = self.N
-        x = self.x
-        y = self.y
-        X = np.zeros((N**2, 8), dtype=int)
-        V = np.zeros((N, N), dtype=int)
-        Y = np.zeros((2, N, N), dtype=int)
-        nrange = self.nrange
-        vrange = self.vrange
-        erange = self.erange
-        for n in nrange:
-            for v in vrange:
-                if self.Value(x[n,v]):
-                    X[n,v] = 1
-                    V[self.n2ij(n)] += v
-        for i,j in erange:
-            nl = self.ij2n(i  , j  )
-            nr = self.ij2n(i  , j+1)
-            nu = self.ij2n(j  , i  )
-            nd = self.ij2n(j+1, i  )
-            if self.Value(y[nl,nr]):
-                Y[0,i,j] = 1
-            if self.Value(y[nu,nd]):
-                Y[1,j,i] = 1
-        return V, X, Y
+        values = self.solutionValues()
+        X = self.arrayValue('x', values)
+        V = self.decodeOneHot(X).reshape(N, N)
+        # Y[0,i,j]: edge (i,j)-(i,j+1), Y[1,i,j]: edge (i,j)-(i+1,j)
+        Y = np.zeros((2, N, N), dtype=np.int8)
+        Y[0,:,:N-1] = self.arrayValue('yh', values)
+        Y[1,:N-1,:] = self.arrayValue('yv', values)
+        return V, X if self.keep_onehot else None, Y
 
     def n2ij(self, n, N=None):
         N = self.N if N is None else N
@@ -96,6 +89,9 @@ class TwentyFourSevenSolver(cp_model.CpSolverSolutionCallback):
             model.Add(2*y[nl,nr] <= sum(x[nl,v] + x[nr,v] for v in vrange if v != 0))
             model.Add(2*y[nu,nd] <= sum(x[nu,v] + x[nd,v] for v in vrange if v != 0))
         self.y = y
+        self.addArray('x', x.values(), (N**2, 8))
+        self.addArray('yh', (y[self.ij2n(i,j), self.ij2n(i,j+1)] for i,j in erange), (N, N-1))
+        self.addArray('yv', (y[self.ij2n(i,j), self.ij2n(i+1,j)] for i,j in product(range(N-1), range(N))), (N-1, N))
 
         # each (n) has exactly one (v) (including 0)
         for n in nrange:
@@ -143,6 +139,7 @@ class TwentyFourSevenSolver(cp_model.CpSolverSolutionCallback):
         # SOLVE
         solver = cp_model.CpSolver()
         solver.parameters.enumerate_all_solutions = self.find_all_solutions
+        solver.parameters.num_search_workers = self.num_search_workers
         status = solver.Solve(model, self)
         return status
 
@@ -1,51 +1,69 @@
 import time
-import numpy as np
 from TwentyFourSevenSolver import TwentyFourSevenSolver
 from scipy.ndimage import label
 
 import logging
-logging.basicConfig(filename='tewntyfourseven2.log', filemode='w',
-    level=logging.INFO,
-    format='[%(levelname)s] %(message)s')
+import multiprocessing
+import os
+import sys
 
 import data
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SolutionChecks import viewsValid
+
 
 def checkView(V, view, side):
-    N, _ = V.shape
-    # left and top views just see head of row/col
-    if side == "l" or side == "t":
-        head = 0
-    # right and bot views just see tail of row/col
-    elif side == "r" or side == "b":
-        head = -1
-    else:
-        raise 
-
-    # top and bottom look at columns, i.e. transposed rows
-    if side == "t" or side == "b":
-        V = V.T
-
-    for it, vt in view:
-        i = np.where(V[it])[0][head]
-        if vt != V[it,i]:
-            return False
-    return True        
-
-def findSolution(vals_list, views, find_all_solutions=False):
-    tstart = time.time()
-    TFSSolver = TwentyFourSevenSolver(vals_list, **views, find_all_solutions=find_all_solutions)
-    solutions = []
-    Ys = []
-    for vals, _, Y in TFSSolver.solutions:
-            solutions.append(vals)
-            Ys.append(Y)
-            break
-    if not solutions:
+    # first value seen from the side in each row/col, one result per grid of a batch
+    return viewsValid(V, {side: view})
+
+def findSolution(vals_list, views, find_all_solutions=False, num_search_workers=0):
+    '''
+    (solution, Y) of the first solution found, or ([solutions], [Ys]) of all of them,
+    None if there is none
+    '''
+    TFSSolver = TwentyFourSevenSolver(vals_list, **views, find_all_solutions=find_all_solutions, keep_onehot=False,
+                                      num_search_workers=num_search_workers)
+    if not TFSSolver.solutions:
         return None
+    solutions = [vals for vals, _, _ in TFSSolver.solutions]
+    Ys = [Y for _, _, Y in TFSSolver.solutions]
     return (solutions[0], Ys[0]) if not find_all_solutions else (solutions, Ys)
 
 
+def solveInstance(task):
+    '''
+    Worker task: first solution of one instance, and how long it took
+    '''
+    k, vals_list, views, num_search_workers = task
+    tstart = time.time()
+    sol = findSolution(vals_list, views, find_all_solutions=False, num_search_workers=num_search_workers)
+    return k, sol, time.time() - tstart
+
+def findSolutions(instances, nprocs=None, timings=None):
+    '''
+    Solve independent (vals_list, views) instances over a process pool and return their
+    (solution, Y) in order, or None as soon as one of them has no solution (the pool is
+    terminated, cancelling the others).
+    timings: optional dict, filled with the solve time of each instance (by index)
+    '''
+    nprocs = nprocs or min(len(instances), multiprocessing.cpu_count())
+    # share the cores between the instances solved at once
+    num_search_workers = max(1, multiprocessing.cpu_count() // nprocs)
+    tasks = [(k, vals_list, views, num_search_workers) for k, (vals_list, views) in enumerate(instances)]
+
+    solutions = [None]*len(instances)
+    with multiprocessing.Pool(nprocs) as pool:
+        for k, sol, elapsed in pool.imap_unordered(solveInstance, tasks):
+            logging.info(f'Instance {k+1}: {elapsed*1000:.2f}ms')
+            if timings is not None:
+                timings[k] = elapsed
+            if sol is None:
+                logging.error(f'Instance {k+1} has no solution, stopping the others')
+                return None
+            solutions[k] = sol
+    return solutions
+
 def main1(vals_list=data.vals_list_1, views=data.views_1):
     '''
     Used to drive a particular instance
@@ -69,11 +87,17 @@ def main1(vals_list=data.vals_list_1, views=data.views_1):
 
 def main():
     tstart = time.time()
-    s1, _ = findSolution(data.vals_list_1, data.views_1, find_all_solutions=False)
-    s2, _ = findSolution(data.vals_list_2, data.views_2, find_all_solutions=False)
-    s3, _ = findSolution(data.vals_list_3, data.views_3, find_all_solutions=False)
-    s4, _ = findSolution(data.vals_list_4, data.views_4, find_all_solutions=False)
+    instances = [(data.vals_list_1, data.views_1), (data.vals_list_2, data.views_2),
+                 (data.vals_list_3, data.views_3), (data.vals_list_4, data.views_4)]
+    timings = {}
+    solutions = findSolutions(instances, timings=timings)
     print(f'Total time: {(time.time() - tstart)*1000: .2f}ms')
+    for k in sorted(timings):
+        print(f'  instance {k+1}: {timings[k]*1000: .2f}ms')
+    if solutions is None:
+        print('NO SOLUTION FOUND')
+        return
+    (s1, _), (s2, _), (s3, _), (s4, _) = solutions
 
     sum_of_grids = s1 + s2 + s3 + s4
     final_sol = (sum_of_grids**2).sum()
@@ -92,6 +116,10 @@ def main():
 
 
 if __name__ == '__main__':
+    # only the parent process writes the log: the pool workers re-import this module
+    logging.basicConfig(filename='tewntyfourseven2.log', filemode='w',
+        level=logging.INFO,
+        format='[%(levelname)s] %(message)s')
     main()
 
     # # drive individual instances
@@ -0,0 +1,108 @@
+import main
+import data
+from SolutionChecks import firstSeen, viewsValid
+
+import numpy as np
+
+import contextlib
+import io
+import unittest
+
+instances = [(data.vals_list_1, data.views_1), (data.vals_list_2, data.views_2),
+             (data.vals_list_3, data.views_3), (data.vals_list_4, data.views_4)]
+
+def loopFirstSeen(V, side):
+    '''
+    Row by row first value seen, as checkView did before SolutionChecks.firstSeen
+    '''
+    # left and top views just see head of row/col, right and bot views the tail
+    head = 0 if side in ('l', 't') else -1
+    # top and bottom look at columns, i.e. transposed rows
+    if side in ('t', 'b'):
+        V = V.T
+    seen = []
+    for row in V:
+        nonzero = np.where(row)[0]
+        seen.append(row[nonzero[head]] if len(nonzero) else 0)
+    return np.array(seen)
+
+class TestSetup(unittest.TestCase):
+
+    def testFirstSeen(self):
+        rng = np.random.default_rng(0)
+        # sparse grids like the solutions, with some empty rows and columns
+        grids = rng.integers(1, 8, size=(20, 7, 7)) * (rng.random((20, 7, 7)) < 0.3)
+        grids[:5, 2] = 0
+        grids[5:10, :, 4] = 0
+        for side in ('t', 'b', 'l', 'r'):
+            seen = firstSeen(grids, side)
+            self.assertEqual(seen.shape, (20, 7))
+            for k, V in enumerate(grids):
+                self.assertTrue((seen[k] == loopFirstSeen(V, side)).all())
+                self.assertTrue((firstSeen(V, side) == seen[k]).all())
+        with self.assertRaises(ValueError):
+            firstSeen(grids[0], 'x')
+
+    def testCheckView(self):
+        V = np.array([
+            [0,3,0],
+            [2,0,1],
+            [0,0,0]
+        ])
+        self.assertTrue(main.checkView(V, ((0,3), (1,2)), 'l'))
+        self.assertTrue(main.checkView(V, ((0,2), (2,1)), 'b'))
+        self.assertFalse(main.checkView(V, ((1,1),), 'l'))
+        self.assertFalse(main.checkView(V, ((1,2),), 't'))
+
+    def testViewsBatch(self):
+        # one result per grid of a batch, as checking the grids one at a time
+        rng = np.random.default_rng(0)
+        solutions = main.findSolutions(instances, nprocs=1)
+        grids = []
+        for vals, _ in solutions:
+            grids.append(vals)
+            # corrupted copies: the first value seen from the left of a row changed
+            for _ in range(3):
+                bad = vals.copy()
+                i = rng.integers(len(bad))
+                j = np.flatnonzero(bad[i])[0]
+                bad[i, j] = bad[i, j] % 7 + 1
+                grids.append(bad)
+        batch = np.array(grids)
+        for _, views in instances:
+            valid = viewsValid(batch, views)
+            self.assertEqual(valid.shape, (len(grids),))
+            self.assertFalse(valid.all())
+            for k, V in enumerate(grids):
+                self.assertEqual(valid[k], viewsValid(V, views))
+            for name, view in views.items():
+                valid = main.checkView(batch, view, name[0])
+                self.assertEqual(valid.shape, (len(grids),))
+                for k, V in enumerate(grids):
+                    seen = loopFirstSeen(V, name[0])
+                    self.assertEqual(valid[k], all(seen[it] == vt for it, vt in view))
+        # every solution meets its own views
+        self.assertTrue(all(viewsValid(vals, views) for (vals, _), (_, views) in zip(solutions, instances)))
+
+    def testFindSolutions(self):
+        # the pool gives the grids of the instances solved one at a time
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = [main.main1(vals_list, views) for vals_list, views in instances]
+        timings = {}
+        solutions = main.findSolutions(instances, nprocs=2, timings=timings)
+        self.assertEqual(len(solutions), len(instances))
+        self.assertEqual(sorted(timings), list(range(len(instances))))
+        for (vals, Y), (expected_vals, expected_Y), (_, views) in zip(solutions, expected, instances):
+            self.assertTrue((vals == expected_vals).all())
+            self.assertTrue((Y == expected_Y).all())
+            for name, view in views.items():
+                self.assertTrue(main.checkView(vals, view, name[0]))
+
+    def testFindSolutionsInfeasible(self):
+        # a clue clashing with the answer of the first instance
+        infeasible = (data.vals_list_1 + (((0,2),5),), data.views_1)
+        self.assertIsNone(main.findSolution(*infeasible))
+        self.assertIsNone(main.findSolutions([infeasible] + instances[1:], nprocs=2))
+
+if __name__ == '__main__':
+    unittest.main()